@@ -36,12 +36,15 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'django.contrib.staticfiles',
+    'school.staticfiles.SchoolStaticFilesConfig',
+    'django.contrib.postgres',
     'web',
     'taggit',
 ]
 
 MIDDLEWARE = [
+    'web.middleware.RequestProfilingMiddleware',
+    'web.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,9 +56,19 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'school.urls'
 
+# WEB_PROFILE_REQUESTS=1: заголовок Server-Timing и строка JSON в лог web.requests на каждый запрос,
+# запросы дольше WEB_SLOW_REQUEST_MS с долей WEB_SLOW_REQUEST_SAMPLE_RATE пишутся в web.slow_requests вместе с SQL
+WEB_PROFILE_REQUESTS = os.environ.get('WEB_PROFILE_REQUESTS') == '1'
+WEB_SLOW_REQUEST_MS = int(os.environ.get('WEB_SLOW_REQUEST_MS', 500))
+WEB_SLOW_REQUEST_SAMPLE_RATE = float(os.environ.get('WEB_SLOW_REQUEST_SAMPLE_RATE', 1))
+
+# WEB_ASYNC_VIEWS=1: каталог и страница курса обслуживаются async-представлениями (имеет смысл под ASGI)
+WEB_ASYNC_VIEWS = os.environ.get('WEB_ASYNC_VIEWS') == '1'
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': ('web.middleware.ProfilingDjangoTemplates' if WEB_PROFILE_REQUESTS
+                    else 'django.template.backends.django.DjangoTemplates'),
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -75,6 +88,9 @@ WSGI_APPLICATION = 'school.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Соединения держатся открытыми CONN_MAX_AGE секунд и проверяются перед переиспользованием,
+# а не открываются заново на каждый запрос. Под ASGI каждый запрос идёт в своём потоке,
+# и постоянные соединения не переиспользуются — там нужен внешний пул (PgBouncer) и DB_CONN_MAX_AGE=0.
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -82,10 +98,51 @@ DATABASES = {
         "USER": "postgres",
         "PASSWORD": "17456",
         "HOST": "localhost",
-        "PORT": 5432
+        "PORT": 5432,
+        "CONN_MAX_AGE": int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# DB_REPLICA_HOST и/или DB_REPLICA_NAME: реплика только для чтения, на неё уходят GET-запросы каталога
+# (см. web.routers). Для проверки локально достаточно второй базы на том же сервере.
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': int(os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT'])),
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['web.routers.PrimaryReplicaRouter']
+
+# сколько секунд после изменения данных чтение пользователя идёт в основную базу
+WEB_PRIMARY_PIN_COOKIE = 'pin_primary'
+WEB_PRIMARY_PIN_SECONDS = int(os.environ.get('WEB_PRIMARY_PIN_SECONDS', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# locmem живёт внутри одного процесса; при нескольких воркерах нужен общий кеш,
+# например django.core.cache.backends.filebased.FileBasedCache
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'school',
+    }
+}
+
+# REDIS_URL: общий для всех процессов кеш (нужен пакет redis). Пользователь сессии кешируется только в нём:
+# сброс после смены пароля или прав должен дойти до всех воркеров, а locmem сбрасывается в одном процессе
+if os.environ.get('REDIS_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+WEB_USER_CACHE = 'shared' if 'shared' in CACHES else None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -125,6 +182,13 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
 )
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# STATIC_PRODUCTION=1: статика собирается `manage.py collectstatic` с хешами в именах
+# и готовыми .gz/.br, а раздаётся из STATIC_ROOT с долгим кешированием (при DEBUG = False)
+STATIC_PRODUCTION = os.environ.get('STATIC_PRODUCTION') == '1'
+if STATIC_PRODUCTION:
+    STATICFILES_STORAGE = 'school.staticfiles.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -133,7 +197,55 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'web.User'
 
+# пароль проверяет ModelBackend (один раз), вход через сайт привязывает сессию к CachedModelBackend,
+# который отдаёт пользователя из общего кеша; старые сессии с ModelBackend остаются действительными
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend', 'web.backends.CachedModelBackend']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'web.requests': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'web.slow_requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 LOGIN_URL = '/stepok/login/'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# одинаковые файлы хранятся один раз, под именем по хешу содержимого
+DEFAULT_FILE_STORAGE = 'web.storage.ContentHashStorage'
+
+# загрузка по кускам: недокачанные файлы лежат вне MEDIA_ROOT, чтобы их не раздавал веб-сервер
+WEB_UPLOAD_TEMP_DIR = os.environ.get('WEB_UPLOAD_TEMP_DIR', os.path.join(BASE_DIR, 'uploads'))
+WEB_UPLOAD_MAX_BYTES = int(os.environ.get('WEB_UPLOAD_MAX_BYTES', 20 * 1024 * 1024))
+WEB_UPLOAD_EXPIRE_HOURS = int(os.environ.get('WEB_UPLOAD_EXPIRE_HOURS', 24))
+# ограничения проверяются по заголовку файла, до декодирования картинки
+WEB_IMAGE_MAX_SIDE = int(os.environ.get('WEB_IMAGE_MAX_SIDE', 8000))
+WEB_IMAGE_MAX_PIXELS = int(os.environ.get('WEB_IMAGE_MAX_PIXELS', 40_000_000))
+
+# просмотры курсов копятся в памяти процесса и пишутся в БД пачкой не чаще раза в WEB_VIEW_FLUSH_SECONDS
+# или когда в буфере наберётся WEB_VIEW_FLUSH_SIZE курсов; сортировка «популярные» — за WEB_POPULAR_DAYS дней
+WEB_VIEW_FLUSH_SECONDS = int(os.environ.get('WEB_VIEW_FLUSH_SECONDS', 10))
+WEB_VIEW_FLUSH_SIZE = int(os.environ.get('WEB_VIEW_FLUSH_SIZE', 1000))
+WEB_POPULAR_DAYS = int(os.environ.get('WEB_POPULAR_DAYS', 7))
+
+# сайтмапы собираются командой build_sitemaps в готовые файлы; ссылки в них абсолютные
+WEB_SITE_URL = os.environ.get('WEB_SITE_URL', 'http://127.0.0.1:8000')
+WEB_SITEMAP_ROOT = os.environ.get('WEB_SITEMAP_ROOT', os.path.join(BASE_DIR, 'sitemaps'))
+
+# фоновые задачи (web.tasks) лежат в таблице web_task, их выполняет manage.py run_worker;
+# WEB_TASKS_EAGER выполняет их сразу после коммита в процессе запроса, без воркера
+WEB_TASKS_EAGER = os.environ.get('WEB_TASKS_EAGER') == '1'
+WEB_TASK_POLL_SECONDS = float(os.environ.get('WEB_TASK_POLL_SECONDS', 1))
+WEB_TASK_RETRY_DELAY = int(os.environ.get('WEB_TASK_RETRY_DELAY', 10))
+# задача в running дольше этого считается брошенной умершим воркером
+WEB_TASK_TIMEOUT = int(os.environ.get('WEB_TASK_TIMEOUT', 60 * 30))
+
+# за обратным прокси: заголовок META с адресом клиента, который выставляет сам прокси
+# (HTTP_X_REAL_IP или HTTP_X_FORWARDED_FOR); пусто — адрес берётся из REMOTE_ADDR
+WEB_CLIENT_IP_HEADER = os.environ.get('WEB_CLIENT_IP_HEADER', '')
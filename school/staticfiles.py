@@ -0,0 +1,97 @@
+import functools
+import gzip
+import mimetypes
+import os
+import posixpath
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles.apps import StaticFilesConfig
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map')
+COMPRESS_MIN_SIZE = 256
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class SchoolStaticFilesConfig(StaticFilesConfig):
+    # исходники темы, демо-страницы шрифтов и форматы, которые не нужны
+    # современным браузерам (в CSS оставлены только woff2/woff)
+    ignore_patterns = StaticFilesConfig.ignore_patterns + [
+        'scss', '*.scss', '*.map',
+        'demo.html', 'demo-files', 'selection.json', 'Read Me.txt',
+        'backup.txt', 'license', 'flaticon.html', '_flaticon.css',
+        '*.eot', '*.ttf', 'Flaticon.svg', 'icomoon.svg',
+    ]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            # сторонние CSS темы ссылаются на картинки, которых нет в репозитории
+            if content is not None or filename is not None:
+                raise
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        if len(content) < COMPRESS_MIN_SIZE:
+            return
+        for suffix, compressed in (('.gz', gzip.compress(content, compresslevel=9, mtime=0)),
+                                   ('.br', brotli.compress(content, quality=11))):
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+
+
+@functools.lru_cache(maxsize=None)
+def _hashed_paths():
+    return frozenset(staticfiles_storage.hashed_files.values())
+
+
+def serve(request, path):
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404(path)
+    if not os.path.isfile(fullpath):
+        raise Http404(path)
+
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if name in accept_encoding and os.path.isfile(fullpath + suffix):
+            encoding, fullpath = name, fullpath + suffix
+            break
+
+    response = FileResponse(open(fullpath, 'rb'), content_type=content_type or 'application/octet-stream')
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if path in _hashed_paths() else REVALIDATE_CACHE_CONTROL
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
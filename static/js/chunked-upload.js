@@ -0,0 +1,118 @@
+// Загрузка картинки по кускам для полей с data-chunked-upload: файл уходит кусками на uploads/,
+// после обрыва докачивается с последнего принятого байта, а форма отправляет только id загрузки.
+(function () {
+    var CHUNK_SIZE = 1024 * 1024;
+    var RETRIES = 5;
+
+    function csrfToken(form) {
+        var input = form.querySelector('input[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    // ответ не 2xx превращается в ошибку со статусом и телом: {error: ...} или состояние загрузки
+    function request(method, url, token, body, headers) {
+        headers = Object.assign({'X-CSRFToken': token}, headers || {});
+        return fetch(url, {method: method, body: body, headers: headers, credentials: 'same-origin'})
+            .then(function (response) {
+                return response.json().catch(function () {
+                    // прокси на 502/504 отдаёт HTML, а не JSON
+                    return {};
+                }).then(function (data) {
+                    if (!response.ok) {
+                        var error = new Error(data.error || response.statusText || 'ошибка ' + response.status);
+                        error.status = response.status;
+                        error.data = data;
+                        throw error;
+                    }
+                    return data;
+                });
+            });
+    }
+
+    function retryable(error) {
+        // сеть оборвалась, предыдущий кусок ещё пишется или сервер временно недоступен
+        return error instanceof TypeError || error.status === 409 || error.status >= 500;
+    }
+
+    function sendChunks(file, state, token, onProgress, retries) {
+        if (state.completed) {
+            return Promise.resolve(state);
+        }
+        var end = Math.min(state.offset + CHUNK_SIZE, file.size);
+        return request('PATCH', state.url, token, file.slice(state.offset, end), {'Upload-Offset': state.offset})
+            .then(function (next) {
+                onProgress(next.offset / file.size);
+                return sendChunks(file, next, token, onProgress, RETRIES);
+            }, function (error) {
+                if (retries <= 0) {
+                    throw error;
+                }
+                if (error.status === 409 && error.data.offset !== undefined) {
+                    // у сервера другое смещение: продолжаем с того места, которое он принял
+                    return sendChunks(file, error.data, token, onProgress, retries - 1);
+                }
+                if (!retryable(error)) {
+                    throw error;
+                }
+                // ждём и спрашиваем, сколько дошло, и продолжаем с этого места
+                return new Promise(function (resolve) {
+                    setTimeout(resolve, 1000 * (RETRIES - retries + 1));
+                }).then(function () {
+                    return request('GET', state.url, token);
+                }).then(function (current) {
+                    return sendChunks(file, current, token, onProgress, retries - 1);
+                });
+            });
+    }
+
+    function upload(input) {
+        var form = input.form;
+        var file = input.files[0];
+        var hidden = form.querySelector('input[name=upload]');
+        var status = input.parentNode.querySelector('.chunked-upload-status');
+        var submit = form.querySelector('button, input[type=submit]');
+        if (!file || !hidden) {
+            return;
+        }
+        if (!status) {
+            status = document.createElement('small');
+            status.className = 'chunked-upload-status d-block';
+            input.parentNode.appendChild(status);
+        }
+        var token = csrfToken(form);
+        var data = new FormData();
+        data.append('filename', file.name);
+        data.append('size', file.size);
+
+        hidden.value = '';
+        if (submit) {
+            submit.disabled = true;
+        }
+        request('POST', input.dataset.chunkedUpload, token, data)
+            .then(function (state) {
+                return sendChunks(file, state, token, function (progress) {
+                    status.textContent = 'Загружено ' + Math.round(progress * 100) + '%';
+                }, RETRIES);
+            })
+            .then(function (state) {
+                hidden.value = state.id;
+                // сам файл второй раз с формой не отправляем
+                input.value = '';
+                status.textContent = file.name + ' загружен';
+            })
+            .catch(function (error) {
+                status.textContent = 'Не удалось загрузить: ' + error.message;
+            })
+            .then(function () {
+                if (submit) {
+                    submit.disabled = false;
+                }
+            });
+    }
+
+    document.querySelectorAll('input[data-chunked-upload]').forEach(function (input) {
+        input.addEventListener('change', function () {
+            upload(input);
+        });
+    });
+})();
@@ -1,10 +1,62 @@
-from web.models import Course, User, UserInfo, Comment, Category
-from django.contrib import admin
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from web.exports import export_response
+from web.facets import PRICE_BANDS, price_band_q
+from web.models import Course, CoursePurge, Task, User, UserInfo, Comment, Category, course_search_query
+from web.pagination import EstimatedCountPaginator
+from web.purge import soft_delete_course
+from django.contrib import admin, messages
+
+SHORT_TEXT_LENGTH = 80
+
+
+@admin.action(description='Выгрузить в CSV')
+def export_csv(modeladmin, request, queryset):
+    return export_response(queryset, 'csv')
+
+
+@admin.action(description='Выгрузить в JSONL')
+def export_jsonl(modeladmin, request, queryset):
+    return export_response(queryset, 'jsonl')
+
+
+class CategoryListFilter(admin.SimpleListFilter):
+    # EXISTS вместо JOIN по m2m: без дублей строк и без DISTINCT на всю таблицу
+    title = 'категория'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        return Category.objects.order_by('name').values_list('id', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(Exists(Course.category.through.objects.filter(
+                course_id=OuterRef('pk'), category_id=self.value(),
+            )))
+        return queryset
+
+
+class PriceBandListFilter(admin.SimpleListFilter):
+    title = 'цена'
+    parameter_name = 'price_band'
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, label, _, _ in PRICE_BANDS]
+
+    def queryset(self, request, queryset):
+        if self.value() in {key for key, _, _, _ in PRICE_BANDS}:
+            return queryset.filter(price_band_q(self.value()))
+        return queryset
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ['username', 'first_name', 'last_name', 'email', 'image']
+    # префиксный поиск идёт по индексу user_username_upper_idx
+    search_fields = ['^username']
     filter_horizontal = ['groups', 'user_permissions']
     fields = ['password', 'last_login', 'groups', ('username', 'email'), ('first_name', 'last_name'), 'image',
               ('is_active', 'is_staff')]
@@ -16,22 +68,102 @@ class UserInfoAdmin(admin.ModelAdmin):
     list_display = ['user', 'name', 'bio', 'avatar', 'is_teacher']
     fields = ['user', 'name', 'bio', 'avatar', 'is_teacher']
     ordering = ['is_teacher']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
 
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ['user', 'tags', 'title', 'text', 'image', 'slug', 'price']
+    list_display = ['title', 'user', 'tag_list', 'short_text', 'price', 'comment_count', 'created_date']
     fields = ['user', 'tags', 'title', 'text', 'image', 'slug', 'category', 'price']
-    ordering = ['title']
+    # совпадает с индексом course_created_id_idx, админка сама добавляет -pk
+    ordering = ['-created_date']
     prepopulated_fields = {'slug': ('title',)}
     filter_horizontal = ['category']
+    actions = [export_csv, export_jsonl]
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    # поиск переопределён в get_search_results, поля нужны, чтобы админка показала строку поиска
+    search_fields = ['title']
+    list_filter = [CategoryListFilter, PriceBandListFilter, 'created_date']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return (
+            super().get_queryset(request)
+            .defer('text', 'search_vector')
+            .annotate(text_preview=Substr('text', 1, SHORT_TEXT_LENGTH))
+            .prefetch_related('tags')
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # число — id курса, иначе полнотекстовый поиск по GIN-индексу или точное имя автора
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(pk=search_term), False
+        if request.path.endswith('autocomplete/'):
+            # в автодополнение вводят начало названия, его ищем по индексу course_title_upper_idx
+            return queryset.filter(title__istartswith=search_term), False
+        return queryset.filter(
+            Q(search_vector=course_search_query(search_term)) | Q(user__username__iexact=search_term)
+        ), False
+
+    def get_deleted_objects(self, objs, request):
+        # удаление мягкое: комментарии курса не собираем для страницы подтверждения, их дочистит фон
+        objs = list(objs)
+        return [str(obj) for obj in objs], {Course._meta.verbose_name_plural: len(objs)}, set(), []
+
+    def delete_model(self, request, obj):
+        soft_delete_course(obj)
+
+    def delete_queryset(self, request, queryset):
+        for course in queryset:
+            soft_delete_course(course)
+
+    @admin.display(description='теги')
+    def tag_list(self, obj):
+        return ', '.join(tag.name for tag in obj.tags.all())
+
+    @admin.display(description='описание')
+    def short_text(self, obj):
+        return obj.text_preview
 
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
-    list_display = ['course', 'user', 'text', 'create_date']
+    list_display = ['course', 'user', 'short_text', 'create_date']
     list_per_page = 5
-    ordering = ['user']
+    ordering = ['-create_date']
+    actions = [export_csv, export_jsonl]
+    autocomplete_fields = ['course', 'user']
+    search_fields = ['text']
+    list_filter = ['create_date']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return (
+            super().get_queryset(request)
+            .select_related('course', 'user')
+            .only('id', 'create_date', 'course__id', 'course__title', 'user__id', 'user__username')
+            .annotate(text_preview=Substr('text', 1, SHORT_TEXT_LENGTH))
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # число — id комментария или курса, иначе точное имя автора; ILIKE по тексту на большой таблице не проходит
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(Q(pk=search_term) | Q(course_id=search_term)), False
+        return queryset.filter(user__username__iexact=search_term), False
+
+    @admin.display(description='текст')
+    def short_text(self, obj):
+        return obj.text_preview
 
 
 @admin.register(Category)
@@ -39,3 +171,48 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'description']
     list_per_page = 5
     ordering = ['name']
+
+
+@admin.register(CoursePurge)
+class CoursePurgeAdmin(admin.ModelAdmin):
+    list_display = ['course_id', 'title', 'state', 'stage', 'deleted_rows', 'total_rows', 'created_at', 'finished_at']
+    list_filter = ['state']
+    ordering = ['-created_at']
+    search_fields = ['title']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'args', 'state', 'priority', 'attempts', 'max_attempts', 'run_at', 'worker', 'created_at']
+    list_filter = ['state', 'name']
+    ordering = ['-created_at']
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='Повторить упавшие задачи')
+    def retry(self, request, queryset):
+        # если такая же задача уже ждёт в очереди, упавшую повторять незачем;
+        # из выбранных упавших с одним ключом повторяется одна, как в requeue_stale
+        failed = queryset.filter(state=Task.FAILED)
+        queued = Task.objects.filter(state=Task.QUEUED, key=OuterRef('key')).exclude(key='')
+        twin = failed.filter(key=OuterRef('key'), id__lt=OuterRef('id')).exclude(key='')
+        try:
+            with transaction.atomic():
+                retried = (failed.exclude(Exists(queued)).exclude(Exists(twin))
+                           .update(state=Task.QUEUED, attempts=0, run_at=timezone.now()))
+        except IntegrityError:
+            # такую же задачу поставили в очередь прямо сейчас
+            self.message_user(request, 'Очередь изменилась, повторите действие', messages.WARNING)
+            return
+        self.message_user(request, 'Поставлено в очередь: %d' % retried)
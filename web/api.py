@@ -0,0 +1,99 @@
+import hashlib
+import json
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET
+
+from web.models import Comment, Course, TagCount
+from web.pagination import KeysetPaginator
+
+PAGE_SIZE = 20
+TAGS_PAGE_SIZE = 100
+
+COURSE_FIELDS = ('id', 'title', 'slug', 'price', 'image', 'created_date', 'comment_count', 'user__username')
+
+
+def json_response(request, payload):
+    body = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # отдаёт 304, если у клиента уже есть это тело
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def page_payload(page, items):
+    return {
+        'results': items,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def attach_tags_and_categories(courses):
+    # пустая страница (курсор за краем) — нечего догружать
+    if not courses:
+        return courses
+    ids = [course['id'] for course in courses]
+    tags, categories = defaultdict(list), defaultdict(list)
+    tagged = Course.tags.through.objects.filter(
+        content_type=ContentType.objects.get_for_model(Course), object_id__in=ids,
+    ).values_list('object_id', 'tag__slug')
+    for course_id, slug in tagged:
+        tags[course_id].append(slug)
+    for course_id, name in Course.category.through.objects.filter(course_id__in=ids).values_list(
+            'course_id', 'category__name'):
+        categories[course_id].append(name)
+    for course in courses:
+        course['author'] = course.pop('user__username')
+        course['tags'] = sorted(tags[course['id']])
+        course['categories'] = sorted(categories[course['id']])
+    return courses
+
+
+@require_GET
+def course_list(request):
+    courses = Course.objects.values(*COURSE_FIELDS)
+    if request.GET.get('tag'):
+        courses = courses.filter(tags__slug=request.GET['tag'])
+    page = KeysetPaginator(courses, PAGE_SIZE).page(request.GET.get('cursor'))
+    return json_response(request, page_payload(page, attach_tags_and_categories(page.object_list)))
+
+
+@require_GET
+def course_detail(request, id):
+    course = Course.objects.filter(pk=id).values(*COURSE_FIELDS, 'text').first()
+    if course is None:
+        raise Http404('Курс не найден')
+    return json_response(request, attach_tags_and_categories([course])[0])
+
+
+@require_GET
+def course_comments(request, id):
+    if not Course.objects.filter(pk=id).exists():
+        raise Http404('Курс не найден')
+    comments = Comment.objects.filter(course_id=id).values('id', 'text', 'create_date', 'user__username')
+    page = KeysetPaginator(comments, PAGE_SIZE, date_field='create_date').page(request.GET.get('cursor'))
+    for comment in page.object_list:
+        comment['author'] = comment.pop('user__username')
+    return json_response(request, page_payload(page, page.object_list))
+
+
+@require_GET
+def tag_list(request):
+    # теги идут по алфавиту, курсором служит slug последнего тега страницы
+    tags = TagCount.objects.filter(count__gt=0).order_by('tag__slug')
+    if request.GET.get('after'):
+        tags = tags.filter(tag__slug__gt=request.GET['after'])
+    items = list(tags.values('tag__name', 'tag__slug', 'count')[:TAGS_PAGE_SIZE + 1])
+    has_next = len(items) > TAGS_PAGE_SIZE
+    items = [{'name': tag['tag__name'], 'slug': tag['tag__slug'], 'courses': tag['count']}
+             for tag in items[:TAGS_PAGE_SIZE]]
+    return json_response(request, {
+        'results': items,
+        'next': items[-1]['slug'] if has_next else None,
+    })
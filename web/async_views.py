@@ -0,0 +1,124 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
+from django.views import View
+
+from web import views
+from web.cache import (CATALOG_NAMESPACE, CATEGORIES_NAMESPACE, PAGE_CACHE_TIMEOUT, RELATED_NAMESPACE, course_namespace,
+                       is_cacheable, page_cache_key, tag_namespace)
+from web.forms import CommentForm
+from web.models import Course, RelatedCourse, TagCount
+from web.pagination import KeysetPaginator
+from web.popularity import PopularPaginator, record_view
+from web.recommendations import RELATED_LIMIT
+
+
+def _is_authenticated(request):
+    return request.user.is_authenticated
+
+
+async def is_authenticated(request):
+    # без куки сессии пользователь точно анонимный, и ходить в синхронный поток незачем
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return False
+    # AuthenticationMiddleware достаёт пользователя лениво и синхронно
+    return await sync_to_async(_is_authenticated)(request)
+
+
+class AsyncCatalogView(View):
+    template_name = None
+    replica_reads = True
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    def get_cache_namespaces(self):
+        raise NotImplementedError
+
+    async def get_context_data(self):
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs):
+        key = None
+        if not await is_authenticated(request):
+            # locmem и файловый кеш не ходят в сеть, вызываем их без перехода в синхронный поток
+            key = page_cache_key(request, self.get_cache_namespaces())
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+        # все запросы к БД выполнены в get_context_data, шаблон работает с готовыми объектами
+        response = TemplateResponse(request, self.template_name, await self.get_context_data())
+        response.render()
+        if key is not None and is_cacheable(request, response):
+            cache.set(key, (response.content, response['Content-Type']), self.page_cache_timeout)
+        return response
+
+
+class CourseListView(AsyncCatalogView):
+    template_name = 'web/index.html'
+    paginate_by = views.CourseListView.paginate_by
+
+    def get_cache_namespaces(self):
+        return [CATALOG_NAMESPACE]
+
+    def get_queryset(self):
+        return views.course_cards()
+
+    async def get_context_data(self):
+        sort = self.request.GET.get('sort')
+        popular = sort == views.PopularSortMixin.popular_sort
+        paginator = (PopularPaginator if popular else KeysetPaginator)(self.get_queryset(), self.paginate_by)
+        page = await paginator.apage(self.request.GET.get('cursor'))
+        context = {
+            'view': self,
+            'courses': page.object_list,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'most_popular_tags': await TagCount.objects.amost_common(3),
+        }
+        if popular:
+            context.update(sort=sort, pagination_query='sort=' + sort)
+        return context
+
+
+class TagIndexView(CourseListView):
+    def get_cache_namespaces(self):
+        return [tag_namespace(self.kwargs.get('tag_slug')), CATEGORIES_NAMESPACE]
+
+    def get_queryset(self):
+        return views.tag_course_cards(self.kwargs.get('tag_slug'))
+
+
+class CourseDetailView(AsyncCatalogView):
+    template_name = 'web/course-single.html'
+    comments_per_page = views.CourseDetailView.comments_per_page
+
+    def get_cache_namespaces(self):
+        return [course_namespace(self.kwargs['id']), RELATED_NAMESPACE]
+
+    async def get(self, request, *args, **kwargs):
+        response = await super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            record_view(kwargs['id'])
+        return response
+
+    async def get_context_data(self):
+        try:
+            course = await Course.objects.defer('search_vector').select_related('user').aget(pk=self.kwargs['id'])
+        except Course.DoesNotExist:
+            raise Http404('Курс не найден')
+        paginator = KeysetPaginator(views.course_comments(course), self.comments_per_page, date_field='create_date')
+        return {
+            'view': self,
+            'object': course,
+            'course': course,
+            'form': CommentForm(),
+            'comments_page': await paginator.apage(self.request.GET.get('comments')),
+            'related_courses': await RelatedCourse.objects.atop_for(course.pk, RELATED_LIMIT),
+        }
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(views.CourseDetailView.as_view())(request, *args, **kwargs)
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import router, transaction
+
+USER_CACHE_TIMEOUT = 60 * 15
+# путь для auth.login: сессии входа через сайт привязываются к кеширующему бэкенду
+CACHED_BACKEND = 'web.backends.CachedModelBackend'
+
+
+def user_cache_key(user_id):
+    return 'auth-user:%s' % user_id
+
+
+def user_cache():
+    # None — общего кеша нет, пользователь читается из БД на каждый запрос
+    return caches[settings.WEB_USER_CACHE] if settings.WEB_USER_CACHE else None
+
+
+def invalidate_user(user_id):
+    cache = user_cache()
+    if cache is None:
+        return
+    key = user_cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def cached_fields():
+    # хеш пароля в кеш не кладём: сессии хватает готового хеша сессии (User.get_session_auth_hash)
+    return [field for field in get_user_model()._meta.concrete_fields if field.attname != 'password']
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Отдаёт пользователя сессии из общего кеша WEB_USER_CACHE, чтобы просмотр страниц не стоил
+    запроса к БД. Кешируются поля пользователя без пароля и хеш сессии, сбрасываются сигналами
+    при сохранении и удалении пользователя (web.signals). Пароль этот бэкенд не проверяет: вход
+    проверяет стоящий перед ним ModelBackend, а представление входа привязывает сессию к CACHED_BACKEND.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        # ModelBackend уже проверил пароль; второй раз не хешируем и не мешаем следующим бэкендам
+        return None
+
+    def get_user(self, user_id):
+        cache = user_cache()
+        if cache is None:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is not None:
+            names = [field.attname for field in cached_fields()]
+            # пароль остаётся отложенным полем: прочитается из БД, только если к нему обратятся
+            user = get_user_model().from_db(router.db_for_read(get_user_model()), names,
+                                            [cached['fields'][name] for name in names])
+            user._session_auth_hash = cached['session_auth_hash']
+            return user
+        user = super().get_user(user_id)
+        if user is not None:
+            fields = {field.attname: field.get_prep_value(getattr(user, field.attname)) for field in cached_fields()}
+            cache.set(key, {'fields': fields, 'session_auth_hash': user.get_session_auth_hash()}, USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,115 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+
+CATALOG_NAMESPACE = 'catalog'
+CATEGORIES_NAMESPACE = 'categories'
+# блок похожих курсов на страницах курсов, сбрасывается полным пересчётом
+RELATED_NAMESPACE = 'related'
+
+
+def course_namespace(course_id):
+    return 'course:%s' % course_id
+
+
+def tag_namespace(tag_slug):
+    return 'tag:%s' % tag_slug
+
+
+def _version_key(namespace):
+    return 'ns-version:%s' % namespace
+
+
+def _initial_version():
+    # если ключ версии вытеснили из кеша, новая версия не должна совпасть со старой
+    return int(time.time() * 1000)
+
+
+def get_versions(namespaces):
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(namespaces):
+    for namespace in set(namespaces):
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+
+
+def invalidate(namespaces):
+    namespaces = list(namespaces)
+    transaction.on_commit(lambda: bump_versions(namespaces))
+
+
+def page_cache_key(request, namespaces):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    versions = '.'.join(str(version) for version in get_versions(namespaces))
+    return 'page:%s:%s' % (path, versions)
+
+
+def is_cacheable(request, response):
+    # страницы, выставляющие куки (csrf, сессия), персональны и в кеш не попадают
+    return (
+        response.status_code == 200
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        and not (hasattr(request, 'session') and request.session.modified)
+    )
+
+
+def cached_page(request, namespaces, timeout, respond):
+    key = page_cache_key(request, namespaces)
+    cached = cache.get(key)
+    if cached is not None:
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    response = respond()
+    if hasattr(response, 'render'):
+        response.render()
+    if is_cacheable(request, response):
+        cache.set(key, (response.content, response['Content-Type']), timeout)
+    return response
+
+
+class AnonymousPageCacheMixin:
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    def get_cache_namespaces(self):
+        raise NotImplementedError
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+        return cached_page(request, self.get_cache_namespaces(), self.page_cache_timeout,
+                           lambda: super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs))
+
+
+def versioned_cache_page(get_namespaces, timeout=PAGE_CACHE_TIMEOUT):
+    """
+    Кеш ответа функции-представления под версиями пространств имён, которые get_namespaces
+    возвращает по аргументам URL. Ответ не зависит от пользователя, поэтому кешируется для всех.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            return cached_page(request, get_namespaces(*args, **kwargs), timeout,
+                               lambda: view(request, *args, **kwargs))
+        return wrapper
+    return decorator
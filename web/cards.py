@@ -0,0 +1,116 @@
+"""
+Карточки курсов (CourseCard) для сеток каталога.
+
+Страница каталога, тега или поиска читает готовые строки одним запросом по индексу, без JOIN
+автора и без догрузки тегов и категорий. Карточку пересобирает refresh_course_cards одним
+INSERT ... SELECT ... ON CONFLICT DO UPDATE; его вызывают сигналы курса, тегов, категорий
+и комментариев в той же транзакции, что и само изменение. Удалённым курсам карточка не нужна.
+"""
+from django.db import connections, router
+from taggit.models import Tag
+
+from web.models import Category, Course, CourseCard, User
+
+SUMMARY_LENGTH = 300
+REBUILD_BATCH_SIZE = 2000
+
+CARD_COLUMNS = ('author_id', 'author_name', 'slug', 'title', 'price', 'image', 'summary',
+                'tag_slugs', 'tag_names', 'category_names', 'comment_count', 'created_date')
+
+UPSERT_SQL = '''
+    INSERT INTO {cards} (id, {columns})
+    SELECT course.id, course.user_id, author.username, course.slug, course.title, course.price, course.image,
+           LEFT(course.text, {summary_length}),
+           COALESCE(tags.slugs, '{{}}'), COALESCE(tags.names, '{{}}'), COALESCE(categories.names, '{{}}'),
+           course.comment_count, course.created_date
+    FROM {courses} course
+    JOIN {users} author ON author.id = course.user_id
+    LEFT JOIN LATERAL (
+        SELECT array_agg(tag.slug ORDER BY tag.name, tag.id) AS slugs,
+               array_agg(tag.name ORDER BY tag.name, tag.id) AS names
+        FROM {tagged_items} item JOIN {tags} tag ON tag.id = item.tag_id
+        WHERE item.object_id = course.id
+          AND item.content_type_id = (SELECT id FROM django_content_type WHERE app_label = 'web' AND model = 'course')
+    ) tags ON true
+    LEFT JOIN LATERAL (
+        SELECT array_agg(category.name ORDER BY category.name) AS names
+        FROM {course_categories} link JOIN {categories} category ON category.id = link.category_id
+        WHERE link.course_id = course.id
+    ) categories ON true
+    WHERE course.deleted_at IS NULL AND {where}
+    ON CONFLICT (id) DO UPDATE SET {updates}
+'''
+
+DELETE_SQL = '''
+    DELETE FROM {cards} card
+    WHERE card.id = ANY(%s)
+      AND NOT EXISTS (SELECT 1 FROM {courses} course WHERE course.id = card.id AND course.deleted_at IS NULL)
+'''
+
+
+def _tables():
+    return {
+        'cards': CourseCard._meta.db_table,
+        'courses': Course._meta.db_table,
+        'users': User._meta.db_table,
+        'tagged_items': Course.tags.through._meta.db_table,
+        'tags': Tag._meta.db_table,
+        'course_categories': Course.category.through._meta.db_table,
+        'categories': Category._meta.db_table,
+    }
+
+
+def upsert_sql(where):
+    return UPSERT_SQL.format(
+        where=where, summary_length=SUMMARY_LENGTH, columns=', '.join(CARD_COLUMNS),
+        updates=', '.join('%s = EXCLUDED.%s' % (column, column) for column in CARD_COLUMNS),
+        **_tables(),
+    )
+
+
+def refresh_course_cards(course_ids):
+    """Пересобирает карточки курсов; карточки удалённых и мягко удалённых курсов убирает."""
+    course_ids = sorted({int(course_id) for course_id in course_ids})
+    if not course_ids:
+        return
+    with connections[router.db_for_write(CourseCard)].cursor() as cursor:
+        cursor.execute(DELETE_SQL.format(**_tables()), [course_ids])
+        cursor.execute(upsert_sql('course.id = ANY(%s)'), [course_ids])
+
+
+def rebuild_course_cards(batch_size=REBUILD_BATCH_SIZE):
+    """Полная пересборка диапазонами id, чтобы не держать одну длинную транзакцию; возвращает число карточек."""
+    using = router.db_for_write(CourseCard)
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM {cards} card WHERE NOT EXISTS (SELECT 1 FROM {courses} course '
+                       'WHERE course.id = card.id AND course.deleted_at IS NULL)'.format(**_tables()))
+        bounds = Course.objects.values_list('id', flat=True).order_by('id')
+        low = bounds.first()
+        high = bounds.last()
+        total = 0
+        while low is not None and low <= high:
+            cursor.execute(upsert_sql('course.id >= %s AND course.id < %s'), [low, low + batch_size])
+            total += cursor.rowcount
+            low += batch_size
+    return total
+
+
+def course_ids_for_tag(tag_id):
+    return Course.tags.through.objects.filter(tag_id=tag_id, content_type__app_label='web',
+                                              content_type__model='course').values_list('object_id', flat=True)
+
+
+def course_ids_for_category(category_id):
+    return Course.category.through.objects.filter(category_id=category_id).values_list('course_id', flat=True)
+
+
+def rename_author(user):
+    """Возвращает, сколько карточек сменили имя автора."""
+    cards = CourseCard.objects.filter(author_id=user.pk).exclude(author_name=user.username)
+    return cards.update(author_name=user.username)
+
+
+def cards_in_order(course_ids):
+    cards = CourseCard.objects.in_bulk(course_ids)
+    return [cards[course_id] for course_id in course_ids if course_id in cards]
+
@@ -0,0 +1,78 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from web.models import Comment, Course
+
+EXPORT_CHUNK_SIZE = 2000
+
+COURSE_COLUMNS = ('id', 'title', 'slug', 'price', 'created_date', 'author', 'author_email', 'tags', 'categories',
+                  'comment_count', 'text')
+COMMENT_COLUMNS = ('id', 'course_id', 'course_title', 'author', 'author_email', 'create_date', 'text')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def course_rows(queryset):
+    # iterator(chunk_size) с prefetch_related подгружает теги и категории пачками,
+    # поэтому в памяти одновременно не больше одной пачки курсов.
+    # defer(None): список курсов в админке откладывает text, без сброса каждый курс догружал бы его отдельно
+    queryset = (
+        queryset.order_by('pk')
+        .defer(None)
+        .select_related('user')
+        .only('id', 'title', 'slug', 'price', 'created_date', 'comment_count', 'text', 'user__username',
+              'user__email')
+        .prefetch_related('tags', 'category')
+    )
+    for course in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield (course.id, course.title, course.slug, course.price, course.created_date, course.user.username,
+               course.user.email, ', '.join(sorted(tag.name for tag in course.tags.all())),
+               ', '.join(sorted(category.name for category in course.category.all())), course.comment_count,
+               course.text)
+
+
+def comment_rows(queryset):
+    queryset = queryset.order_by('pk').values_list('id', 'course_id', 'course__title', 'user__username',
+                                                   'user__email', 'create_date', 'text')
+    yield from queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+EXPORTS = {
+    Course: (COURSE_COLUMNS, course_rows),
+    Comment: (COMMENT_COLUMNS, comment_rows),
+}
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def iter_export(queryset, file_format):
+    columns, rows = EXPORTS[queryset.model]
+    serialize = iter_csv if file_format == 'csv' else iter_jsonl
+    return serialize(columns, rows(queryset))
+
+
+def export_response(queryset, file_format):
+    response = StreamingHttpResponse(iter_export(queryset, file_format), content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (queryset.model._meta.model_name, file_format)
+    return response
@@ -0,0 +1,149 @@
+from functools import reduce
+from operator import or_
+from urllib.parse import urlencode
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Exists, OuterRef, Q
+from taggit.models import Tag
+
+from web.models import Category, Course, FacetCount, TagCount
+
+# ключ, подпись, нижняя граница включительно, верхняя не включительно
+PRICE_BANDS = [
+    ('none', 'Без цены', None, None),
+    ('lt-1000', 'До 1 000', None, 1000),
+    ('1000-5000', '1 000 – 5 000', 1000, 5000),
+    ('5000-20000', '5 000 – 20 000', 5000, 20000),
+    ('20000+', 'От 20 000', 20000, None),
+]
+NO_PRICE = 'none'
+
+TAG_FACET_LIMIT = 15
+
+
+def price_band(price):
+    if price is None:
+        return NO_PRICE
+    for key, _, low, high in PRICE_BANDS[1:]:
+        if (low is None or price >= low) and (high is None or price < high):
+            return key
+
+
+def price_band_q(key):
+    if key == NO_PRICE:
+        return Q(price__isnull=True)
+    _, _, low, high = next(band for band in PRICE_BANDS if band[0] == key)
+    q = Q(price__isnull=False)
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+class CatalogFilters:
+    """
+    Выбранные значения фасетов из GET-параметров category, price и tag.
+    Внутри фасета значения объединяются через ИЛИ, фасеты между собой — через И.
+    """
+
+    def __init__(self, params):
+        self.categories = sorted({int(value) for value in params.getlist('category') if value.isdigit()})
+        prices = params.getlist('price')
+        self.prices = [key for key, _, _, _ in PRICE_BANDS if key in prices]
+        self.tags = sorted(set(params.getlist('tag')))
+
+    def active(self, skip=None):
+        return any(values for facet, values in self.selected().items() if facet != skip)
+
+    def selected(self):
+        return {'category': self.categories, 'price': self.prices, 'tag': self.tags}
+
+    def apply(self, queryset, skip=None):
+        # EXISTS вместо JOIN: курс с двумя подходящими категориями не задваивается и DISTINCT не нужен
+        if self.categories and skip != 'category':
+            queryset = queryset.filter(Exists(Course.category.through.objects.filter(
+                course_id=OuterRef('pk'), category_id__in=self.categories,
+            )))
+        if self.prices and skip != 'price':
+            queryset = queryset.filter(reduce(or_, (price_band_q(key) for key in self.prices)))
+        if self.tags and skip != 'tag':
+            queryset = queryset.filter(Exists(Course.tags.through.objects.filter(
+                content_type=ContentType.objects.get_for_model(Course), object_id=OuterRef('pk'),
+                tag__slug__in=self.tags,
+            )))
+        return queryset
+
+    def querystring(self):
+        return urlencode([(facet, value) for facet, values in self.selected().items() for value in values])
+
+
+def category_facet(filters):
+    # счётчик значения фасета учитывает фильтры остальных фасетов, но не свой собственный
+    if filters.active(skip='category'):
+        counts = dict(
+            Course.category.through.objects
+            .filter(course__in=filters.apply(Course.objects.all(), skip='category').values('pk'))
+            .values('category_id')
+            .annotate(count=Count('id'))
+            .values_list('category_id', 'count')
+        )
+    else:
+        counts = {int(value): count for value, count in FacetCount.objects.counts(FacetCount.CATEGORY).items()}
+    return [
+        {'value': category.id, 'label': category.name, 'count': counts.get(category.id, 0),
+         'selected': category.id in filters.categories}
+        for category in Category.objects.only('id', 'name').order_by('name')
+        if counts.get(category.id) or category.id in filters.categories
+    ]
+
+
+def price_facet(filters):
+    if filters.active(skip='price'):
+        counts = filters.apply(Course.objects.all(), skip='price').aggregate(**{
+            key: Count('pk', filter=price_band_q(key)) for key, _, _, _ in PRICE_BANDS
+        })
+    else:
+        counts = FacetCount.objects.counts(FacetCount.PRICE)
+    return [
+        {'value': key, 'label': label, 'count': counts.get(key, 0), 'selected': key in filters.prices}
+        for key, label, _, _ in PRICE_BANDS
+        if counts.get(key) or key in filters.prices
+    ]
+
+
+def tag_facet(filters):
+    if filters.active(skip='tag'):
+        rows = (
+            Course.tags.through.objects
+            .filter(content_type=ContentType.objects.get_for_model(Course),
+                    object_id__in=filters.apply(Course.objects.all(), skip='tag').values('pk'))
+            .values('tag__slug', 'tag__name')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'tag__slug')
+            .values_list('tag__slug', 'tag__name', 'count')
+        )
+    else:
+        top = TagCount.objects.filter(count__gt=0).order_by('-count', 'tag__slug')
+        rows = top.filter(Q(pk__in=top.values('pk')[:TAG_FACET_LIMIT]) | Q(tag__slug__in=filters.tags))
+        rows = rows.values_list('tag__slug', 'tag__name', 'count')
+    items, shown = [], 0
+    for slug, name, count in rows:
+        selected = slug in filters.tags
+        if shown < TAG_FACET_LIMIT or selected:
+            items.append({'value': slug, 'label': name, 'count': count, 'selected': selected})
+            shown += 1
+    # выбранный тег без совпадений всё равно показываем, иначе с него не снять галочку
+    missing = set(filters.tags) - {item['value'] for item in items}
+    if missing:
+        items += [{'value': slug, 'label': name, 'count': 0, 'selected': True}
+                  for slug, name in Tag.objects.filter(slug__in=missing).values_list('slug', 'name')]
+    return items
+
+
+def facet_counts(filters):
+    return [
+        ('category', 'Категории', category_facet(filters)),
+        ('price', 'Цена', price_facet(filters)),
+        ('tag', 'Теги', tag_facet(filters)),
+    ]
@@ -0,0 +1,126 @@
+"""
+RSS и Atom с новыми курсами: все, по тегу и по категории.
+
+Лента собирается одним запросом по .values() с обрезанным в базе описанием, готовый ответ
+кешируется под теми же версиями пространств имён, что и страницы каталога и тегов.
+"""
+from django.contrib.syndication.views import Feed
+from django.db.models.functions import Substr
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from taggit.models import Tag
+
+from web.cache import CATALOG_NAMESPACE, CATEGORIES_NAMESPACE, tag_namespace, versioned_cache_page
+from web.models import Category, Course
+
+FEED_SIZE = 30
+SUMMARY_LENGTH = 300
+
+
+def feed_items(queryset):
+    return (
+        queryset
+        .order_by('-created_date', '-id')
+        .annotate(summary=Substr('text', 1, SUMMARY_LENGTH))
+        .values('id', 'slug', 'title', 'summary', 'created_date', 'modified_date', 'user__username')
+        [:FEED_SIZE]
+    )
+
+
+class CourseFeed(Feed):
+    title = 'Новые курсы'
+    description = 'Последние добавленные курсы'
+
+    def link(self):
+        return reverse('main_page')
+
+    def items(self):
+        return feed_items(Course.objects.all())
+
+    def item_title(self, item):
+        return item['title']
+
+    def item_description(self, item):
+        return item['summary']
+
+    def item_link(self, item):
+        return reverse('single_course', args=(item['slug'], item['id']))
+
+    def item_pubdate(self, item):
+        return item['created_date']
+
+    def item_updateddate(self, item):
+        return item['modified_date']
+
+    def item_author_name(self, item):
+        return item['user__username']
+
+
+class TagCourseFeed(CourseFeed):
+    def get_object(self, request, tag_slug):
+        return get_object_or_404(Tag, slug=tag_slug)
+
+    def title(self, tag):
+        return 'Новые курсы с тегом %s' % tag.name
+
+    def description(self, tag):
+        return 'Последние добавленные курсы с тегом %s' % tag.name
+
+    def link(self, tag):
+        return reverse('courses_by_tag', args=(tag.slug,))
+
+    def items(self, tag):
+        return feed_items(Course.objects.filter(tags=tag))
+
+
+class CategoryCourseFeed(CourseFeed):
+    def get_object(self, request, category_id):
+        return get_object_or_404(Category, pk=category_id)
+
+    def title(self, category):
+        return 'Новые курсы в категории %s' % category.name
+
+    def description(self, category):
+        return 'Последние добавленные курсы в категории %s' % category.name
+
+    def link(self, category):
+        return '%s?category=%s' % (reverse('course_catalog'), category.pk)
+
+    def items(self, category):
+        return feed_items(Course.objects.filter(category=category))
+
+
+class AtomCourseFeed(CourseFeed):
+    feed_type = Atom1Feed
+    subtitle = CourseFeed.description
+
+
+class AtomTagCourseFeed(TagCourseFeed):
+    feed_type = Atom1Feed
+    subtitle = TagCourseFeed.description
+
+
+class AtomCategoryCourseFeed(CategoryCourseFeed):
+    feed_type = Atom1Feed
+    subtitle = CategoryCourseFeed.description
+
+
+def course_namespaces():
+    return [CATALOG_NAMESPACE]
+
+
+def tag_namespaces(tag_slug):
+    return [tag_namespace(tag_slug)]
+
+
+def category_namespaces(category_id):
+    return [CATALOG_NAMESPACE, CATEGORIES_NAMESPACE]
+
+
+courses_rss = versioned_cache_page(course_namespaces)(CourseFeed())
+courses_atom = versioned_cache_page(course_namespaces)(AtomCourseFeed())
+tag_rss = versioned_cache_page(tag_namespaces)(TagCourseFeed())
+tag_atom = versioned_cache_page(tag_namespaces)(AtomTagCourseFeed())
+category_rss = versioned_cache_page(category_namespaces)(CategoryCourseFeed())
+category_atom = versioned_cache_page(category_namespaces)(AtomCategoryCourseFeed())
@@ -1,7 +1,82 @@
+from django.conf import settings
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm, UserChangeForm
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.urls import reverse_lazy
 
-from web.models import User, Course, Comment
+from web.images import ImageRejected, check_image_header, schedule_derivatives
+from web.models import User, Course, Comment, Upload
+
+
+class LimitedImageField(forms.ImageField):
+    # размер файла и картинки проверяем до того, как ImageField откроет и проверит её целиком
+    def to_python(self, data):
+        if data in self.empty_values:
+            return super().to_python(data)
+        if data.size > settings.WEB_UPLOAD_MAX_BYTES:
+            raise ValidationError('Файл должен быть не больше %d МБ' % (settings.WEB_UPLOAD_MAX_BYTES // 2 ** 20),
+                                  code='file_too_large')
+        try:
+            check_image_header(data)
+        except ImageRejected as e:
+            raise ValidationError(str(e), code='invalid_image')
+        return super().to_python(data)
+
+
+class UploadedPart(File):
+    # FileSystemStorage переносит такой файл на место, а не копирует его
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class ImageUploadMixin:
+    """
+    Картинку можно прислать файлом или id завершённой загрузки по кускам (web.uploads) в поле upload.
+    Для новой картинки после сохранения строятся превью.
+    """
+
+    def __init__(self, *args, uploader=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uploader = uploader
+
+    def clean_upload(self):
+        upload_id = self.cleaned_data.get('upload')
+        if not upload_id:
+            return None
+        upload = Upload.objects.filter(pk=upload_id, user=self.uploader, completed=True).first()
+        if upload is None:
+            raise ValidationError('Загрузка не найдена или ещё не завершена')
+        return upload
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('upload')
+        if upload and not self.errors:
+            # файл проверен ещё при загрузке, одинаковые картинки хранилище сложит в один файл
+            cleaned_data['image'] = UploadedPart(open(upload.path, 'rb'), name=upload.filename)
+        return cleaned_data
+
+    def _post_clean(self):
+        super()._post_clean()
+        image = self.cleaned_data.get('image')
+        # проверка модели тоже может найти ошибки, тогда форму не сохранят и файл никто не закроет
+        if self.errors and isinstance(image, UploadedPart):
+            image.close()
+
+    def save(self, commit=True):
+        instance = super().save(commit)
+        upload = self.cleaned_data.get('upload')
+        if commit and upload:
+            self.cleaned_data['image'].close()
+            upload.delete()
+        if commit and ('image' in self.changed_data or upload) and instance.image:
+            schedule_derivatives(instance.image.name)
+        return instance
+
+
+def upload_widget_attrs():
+    return {'data-chunked-upload': reverse_lazy('upload_create'), 'accept': 'image/*'}
 
 
 class UserLoginForm(AuthenticationForm):
@@ -26,20 +101,25 @@ class UserRegistrationForm(UserCreationForm):
         fields = ('first_name', 'last_name', 'username', 'email', 'password1', 'password2')
 
 
-class UserProfileForm(UserChangeForm):
+class UserProfileForm(ImageUploadMixin, UserChangeForm):
     username = forms.CharField(widget=forms.TextInput(attrs={'readonly': True}))
     email = forms.CharField(widget=forms.EmailInput(attrs={'readonly': True}))
-    image = forms.ImageField(widget=forms.FileInput(), required=False)
+    image = LimitedImageField(widget=forms.FileInput(attrs=upload_widget_attrs()), required=False)
+    upload = forms.UUIDField(widget=forms.HiddenInput(), required=False)
 
     class Meta:
         model = User
         fields = ('username', 'email', 'first_name', 'last_name', 'image')
 
 
-class CourseForm(forms.ModelForm):
+class CourseForm(ImageUploadMixin, forms.ModelForm):
+    upload = forms.UUIDField(widget=forms.HiddenInput(), required=False)
+
     class Meta:
         model = Course
         fields = ('title', 'tags', 'price', 'text', 'image')
+        field_classes = {'image': LimitedImageField}
+        widgets = {'image': forms.ClearableFileInput(attrs=upload_widget_attrs())}
 
 
 class CommentForm(forms.ModelForm):
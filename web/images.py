@@ -0,0 +1,110 @@
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from web.storage import save_exact
+from web.tasks import PRIORITY_HIGH, task
+
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_FORMATS = (
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+)
+
+# разбирать загрузки разрешено только этими декодерами Pillow
+UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+EXTENSION_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.webp': 'WEBP'}
+UPLOAD_EXTENSIONS = tuple(EXTENSION_FORMATS)
+
+
+def derivative_name(name, width, extension):
+    root, _ = posixpath.splitext(name)
+    return '%s.%dw.%s' % (root, width, extension)
+
+
+def has_derivatives(name):
+    return default_storage.exists(derivative_name(name, DERIVATIVE_WIDTHS[-1], DERIVATIVE_FORMATS[-1][0]))
+
+
+def generate_derivatives(name, force=False):
+    if not force and has_derivatives(name):
+        return False
+
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        # JPEG декодируется сразу в уменьшенном масштабе, полный размер не нужен
+        image.draft('RGB', (DERIVATIVE_WIDTHS[-1], DERIVATIVE_WIDTHS[-1]))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    for width in DERIVATIVE_WIDTHS:
+        resized = image.copy()
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+        for extension, pil_format, options in DERIVATIVE_FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, **options)
+            save_exact(default_storage, derivative_name(name, width, extension), ContentFile(buffer.getvalue()))
+    return True
+
+
+class ImageRejected(ValueError):
+    pass
+
+
+class NotAnImage(ImageRejected):
+    pass
+
+
+def check_image_header(file):
+    """
+    Проверяет формат и размеры картинки и возвращает (формат, ширина, высота).
+    Image.open читает только заголовок, пиксели не декодируются.
+    """
+    file.seek(0)
+    try:
+        image = Image.open(file, formats=UPLOAD_FORMATS)
+    except UnidentifiedImageError:
+        raise NotAnImage('Загрузите картинку в формате JPEG, PNG, GIF или WebP')
+    except Image.DecompressionBombError:
+        raise ImageRejected('Картинка слишком большая')
+    finally:
+        file.seek(0)
+    if max(image.width, image.height) > settings.WEB_IMAGE_MAX_SIDE:
+        raise ImageRejected('Сторона картинки не должна превышать %d px' % settings.WEB_IMAGE_MAX_SIDE)
+    if image.width * image.height > settings.WEB_IMAGE_MAX_PIXELS:
+        raise ImageRejected('Картинка не должна быть больше %d Мпикс' % (settings.WEB_IMAGE_MAX_PIXELS // 1_000_000))
+    return image.format, image.width, image.height
+
+
+def verify_image(file, filename):
+    """
+    Полная проверка собранного файла: заголовок, совпадение формата с расширением имени
+    и декодирование всех данных картинки. Оборванный или испорченный файл не пройдёт.
+    """
+    image_format, _, _ = check_image_header(file)
+    extension = posixpath.splitext(filename.lower())[1]
+    if EXTENSION_FORMATS.get(extension) != image_format:
+        raise ImageRejected('Файл %s на самом деле в формате %s' % (filename, image_format))
+    try:
+        Image.open(file, formats=UPLOAD_FORMATS).verify()
+        # verify проверяет только структуру (у JPEG почти ничего), пиксели декодирует load
+        file.seek(0)
+        Image.open(file, formats=UPLOAD_FORMATS).load()
+    except Exception:
+        # на битых данных декодеры Pillow бросают разные исключения
+        raise ImageRejected('Файл картинки повреждён')
+    finally:
+        file.seek(0)
+
+
+@task(priority=PRIORITY_HIGH, key=lambda name: 'derivatives:%s' % name)
+def build_derivatives(name):
+    # имя зависит от содержимого: если превью уже есть, они построены из этого же файла
+    generate_derivatives(name)
+
+
+def schedule_derivatives(name):
+    build_derivatives.enqueue(name)
@@ -0,0 +1,149 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from web.management.commands.loadtest import percentile
+from web.models import Comment, Course, TagCount
+
+# (маршрут, нужен ли вход, максимум запросов к БД)
+ROUTES = [
+    ('main_page', False, 2),
+    ('main_page_popular', False, 3),
+    ('courses_by_tag', False, 2),
+    ('single_course', False, 3),
+    ('course_search', False, 3),
+    ('course_catalog', False, 5),
+    ('api_courses', False, 3),
+    ('api_course', False, 3),
+    ('api_course_comments', False, 2),
+    ('api_tags', False, 1),
+    ('login', False, 0),
+    ('register', False, 0),
+    ('main_page', True, 4),
+    ('single_course', True, 5),
+    ('profile', True, 2),
+    ('course_create', True, 2),
+    ('course_update', True, 4),
+    ('course_delete', True, 3),
+    ('update_comment', True, 3),
+]
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет каждый именованный маршрут через тестовый клиент на текущих данных (см. seed_data), '
+            'проверяет лимит запросов к БД и считает перцентили задержки. '
+            'Код выхода ненулевой, если какой-то маршрут вышел за лимит или стал медленнее --baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=30, help='Замеров на маршрут')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Не отключать кеш страниц; по умолчанию меряется работа самого представления')
+        parser.add_argument('--save', help='Сохранить результаты в JSON для сравнения в следующий раз')
+        parser.add_argument('--baseline', help='JSON с прошлого прогона: сравнить p95')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимый рост p95, доля')
+        parser.add_argument('routes', nargs='*', help='Только эти маршруты')
+
+    def handle(self, *args, **options):
+        course = Course.objects.select_related('user').order_by('-created_date', '-id').first()
+        if course is None:
+            raise CommandError('В базе нет курсов, сначала запустите seed_data')
+        comment = Comment.objects.filter(user=course.user).select_related('course').first()
+        tag = TagCount.objects.filter(count__gt=0).select_related('tag').order_by('-count').first()
+
+        urls = {
+            'main_page': reverse('main_page'),
+            'main_page_popular': reverse('main_page') + '?sort=popular',
+            'courses_by_tag': reverse('courses_by_tag', args=(tag.tag.slug,)) if tag else None,
+            'single_course': reverse('single_course', args=(course.slug, course.id)),
+            'course_search': reverse('course_search') + '?q=' + course.title.split()[0],
+            'course_catalog': reverse('course_catalog'),
+            'api_courses': reverse('api_courses'),
+            'api_course': reverse('api_course', args=(course.id,)),
+            'api_course_comments': reverse('api_course_comments', args=(course.id,)),
+            'api_tags': reverse('api_tags'),
+            'login': reverse('login'),
+            'register': reverse('register'),
+            'profile': reverse('profile'),
+            'course_create': reverse('course_create'),
+            'course_update': reverse('course_update', args=(course.slug, course.id)),
+            'course_delete': reverse('course_delete', args=(course.slug, course.id)),
+            'update_comment': reverse('update_comment', args=(
+                comment.course.slug, comment.course_id, comment.id)) if comment else None,
+        }
+
+        cache_settings = {} if options['with_cache'] else {
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        }
+        setup_test_environment()
+        try:
+            with override_settings(**cache_settings):
+                results = self.run_routes(urls, course.user, options)
+        finally:
+            teardown_test_environment()
+
+        failed = self.report(results, options)
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+        if failed:
+            raise CommandError('Регрессия: %s' % ', '.join(failed))
+
+    def run_routes(self, urls, user, options):
+        anonymous, authenticated = Client(), Client()
+        authenticated.force_login(user)
+        results = {}
+        for name, login, budget in ROUTES:
+            if options['routes'] and name not in options['routes'] or urls[name] is None:
+                continue
+            client = authenticated if login else anonymous
+            # первый запрос прогревает шаблоны и кеш ContentType, в замер не идёт
+            client.get(urls[name])
+            latencies, queries, status = [], 0, None
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.get(urls[name])
+                    latencies.append(time.perf_counter() - start)
+                queries = max(queries, len(captured.captured_queries))
+                status = response.status_code
+            results['%s%s' % (name, ' (auth)' if login else '')] = {
+                'url': urls[name],
+                'status': status,
+                'queries': queries,
+                'budget': budget,
+                'p50': percentile(latencies, 50) * 1000,
+                'p95': percentile(latencies, 95) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+            }
+        return results
+
+    def report(self, results, options):
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        failed = []
+        self.stdout.write('%-28s %6s %9s %9s %9s %9s  %s' % ('route', 'status', 'queries', 'p50 ms', 'p95 ms',
+                                                             'p99 ms', ''))
+        for label, result in results.items():
+            problems = []
+            if result['status'] != 200:
+                problems.append('статус %d' % result['status'])
+            if result['queries'] > result['budget']:
+                problems.append('запросов больше %d' % result['budget'])
+            previous = baseline.get(label)
+            if previous and result['p95'] > previous['p95'] * (1 + options['tolerance']):
+                problems.append('p95 было %.1f ms' % previous['p95'])
+            if problems:
+                failed.append(label)
+            line = '%-28s %6d %4d / %-3d %9.1f %9.1f %9.1f  %s' % (
+                label, result['status'], result['queries'], result['budget'], result['p50'], result['p95'],
+                result['p99'], '; '.join(problems))
+            self.stdout.write(self.style.ERROR(line) if problems else line)
+        return failed
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from web.sitemaps import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = ('Собирает сайтмапы курсов, тегов и категорий в WEB_SITEMAP_ROOT. '
+            'Перезаписываются только шарды, где что-то изменилось с прошлой сборки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='пересобрать все шарды')
+
+    def handle(self, *args, **options):
+        written, removed = build_sitemaps(force=options['force'])
+        self.stdout.write(self.style.SUCCESS('Готово: перезаписано шардов %d, удалено %d' % (written, removed)))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from web.models import Upload
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные загрузки по кускам и их временные файлы (старше WEB_UPLOAD_EXPIRE_HOURS)'
+
+    def handle(self, *args, **options):
+        expired = timezone.now() - timedelta(hours=settings.WEB_UPLOAD_EXPIRE_HOURS)
+        # временные файлы убирает сигнал post_delete
+        deleted, _ = Upload.objects.filter(created_at__lt=expired).delete()
+        self.stdout.write(self.style.SUCCESS('Удалено загрузок: %d' % deleted))
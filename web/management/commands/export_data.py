@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from web.exports import iter_export
+from web.models import Comment, Course
+
+MODELS = {
+    'courses': Course,
+    'comments': Comment,
+}
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка курсов или комментариев в CSV/JSONL с автором, тегами и категориями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODELS))
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', help='Файл для записи, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        queryset = MODELS[options['model']].objects.all()
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for chunk in iter_export(queryset, options['format']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from web.images import generate_derivatives
+from web.models import Course, User
+
+
+class Command(BaseCommand):
+    help = 'Строит превью и WebP-версии для уже загруженных картинок курсов и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Перестроить уже существующие превью')
+
+    def handle(self, *args, **options):
+        created = failed = 0
+        for model in (Course, User):
+            names = model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True)
+            for name in names.distinct().iterator():
+                try:
+                    created += generate_derivatives(name, force=options['force'])
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write('%s: %s' % (name, e))
+        self.stdout.write(self.style.SUCCESS('Построено: %d, ошибок: %d' % (created, failed)))
@@ -0,0 +1,208 @@
+import csv
+import itertools
+import json
+import os
+import sys
+from collections import Counter
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+from taggit.models import Tag
+from taggit.utils import parse_tags
+
+from web.cache import CATALOG_NAMESPACE, CATEGORIES_NAMESPACE, invalidate, tag_namespace
+from web.cards import refresh_course_cards
+from web.facets import price_band
+from web.models import Category, Course, FacetCount, TagCount, User
+
+# поля, которые не приходят из файла и проверяются отдельно
+EXCLUDED_FROM_VALIDATION = ['user', 'slug', 'image', 'search_vector', 'comment_count']
+
+
+class RecordError(ValueError):
+    # запись, которую не удалось прочитать, — ошибка этой строки, а не всего импорта
+    pass
+
+
+def read_records(stream, file_format):
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield RecordError('некорректный JSON: %s' % e)
+            continue
+        yield record if isinstance(record, dict) else RecordError('ожидался объект JSON')
+
+
+def as_list(value):
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return parse_tags(value or '')
+
+
+class Command(BaseCommand):
+    help = ('Потоковый импорт курсов с тегами и категориями из CSV или JSONL пачками через bulk_create. '
+            'Колонки: username, title, text, price, tags, categories')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или - для stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить записи, ничего не сохранять')
+        parser.add_argument('--resume', action='store_true', help='Продолжить с места, записанного в --state-file')
+        parser.add_argument('--state-file', help='Файл прогресса, по умолчанию <path>.progress')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        state_file = options['state_file'] or (None if path == '-' else path + '.progress')
+        if options['resume'] and not state_file:
+            raise CommandError('Для --resume при чтении из stdin нужен --state-file')
+
+        skip = 0
+        if options['resume'] and os.path.exists(state_file):
+            with open(state_file) as f:
+                skip = json.load(f)['processed']
+            self.stdout.write('Пропускаем уже импортированные записи: %d' % skip)
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        self.content_type = ContentType.objects.get_for_model(Course)
+        processed, imported, failed = skip, 0, 0
+        try:
+            records = itertools.islice(enumerate(read_records(stream, file_format), start=1), skip, None)
+            while True:
+                batch = list(itertools.islice(records, options['batch_size']))
+                if not batch:
+                    break
+                rows, errors = self.validate(batch)
+                for line, error in errors:
+                    self.stderr.write('запись %d: %s' % (line, error))
+                if not options['dry_run']:
+                    self.import_batch(rows)
+                processed += len(batch)
+                imported += len(rows)
+                failed += len(errors)
+                if not options['dry_run'] and state_file:
+                    self.save_state(state_file, processed)
+                self.stdout.write('Обработано: %d, импортировано: %d, ошибок: %d' % (processed, imported, failed))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        verb = 'Проверено' if options['dry_run'] else 'Импортировано'
+        self.stdout.write(self.style.SUCCESS('%s курсов: %d, ошибок: %d' % (verb, imported, failed)))
+
+    def save_state(self, state_file, processed):
+        tmp = state_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'processed': processed}, f)
+        os.replace(tmp, state_file)
+
+    def validate(self, batch):
+        usernames = {str(record.get('username') or '').strip() for _, record in batch
+                     if not isinstance(record, RecordError)}
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        rows, errors = [], []
+        for line, record in batch:
+            if isinstance(record, RecordError):
+                errors.append((line, str(record)))
+                continue
+            username = str(record.get('username') or '').strip()
+            if username not in users:
+                errors.append((line, 'пользователь %r не найден' % username))
+                continue
+            price = record.get('price')
+            course = Course(
+                user_id=users[username],
+                title=str(record.get('title') or '').strip(),
+                text=str(record.get('text') or ''),
+                price=int(price) if str(price or '').strip().isdigit() else None,
+            )
+            if str(price or '').strip() and course.price is None:
+                errors.append((line, 'цена должна быть целым числом: %r' % price))
+                continue
+            try:
+                course.clean_fields(exclude=EXCLUDED_FROM_VALIDATION)
+            except ValidationError as e:
+                errors.append((line, '; '.join('%s: %s' % (k, ' '.join(v)) for k, v in e.message_dict.items())))
+                continue
+            tag_names, category_names = as_list(record.get('tags')), as_list(record.get('categories'))
+            too_long = self.too_long(Tag, tag_names) or self.too_long(Category, category_names)
+            if too_long:
+                errors.append((line, too_long))
+                continue
+            # слаг строится так же, как в CourseCreateView.form_valid
+            course.slug = slugify(course.title, allow_unicode=True)
+            rows.append((course, tag_names, category_names))
+        return rows, errors
+
+    def too_long(self, model, names):
+        max_length = model._meta.get_field('name').max_length
+        for name in names:
+            if len(name) > max_length:
+                return '%s: название длиннее %d символов: %r' % (model._meta.verbose_name, max_length, name)
+        return None
+
+    def resolve_tags(self, names):
+        tags = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = [Tag(name=name, slug=Tag().slugify(name)) for name in names if name not in tags]
+        if missing:
+            Tag.objects.bulk_create(missing, ignore_conflicts=True)
+            tags.update(Tag.objects.filter(name__in=[tag.name for tag in missing]).values_list('name', 'id'))
+            # совпадения слагов у разных имён разруливает сам taggit при обычном сохранении
+            for name in names:
+                if name not in tags:
+                    tags[name] = Tag.objects.get_or_create(name=name)[0].id
+        return tags
+
+    def resolve_categories(self, names):
+        categories = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = [Category(name=name) for name in names if name not in categories]
+        if missing:
+            Category.objects.bulk_create(missing, ignore_conflicts=True)
+            categories.update(Category.objects.filter(name__in=names).values_list('name', 'id'))
+        return categories
+
+    @transaction.atomic
+    def import_batch(self, rows):
+        if not rows:
+            return
+        tags = self.resolve_tags({name for _, tag_names, _ in rows for name in tag_names})
+        categories = self.resolve_categories({name for _, _, category_names in rows for name in category_names})
+
+        courses = Course.objects.bulk_create([course for course, _, _ in rows])
+
+        tagged_items, course_categories = [], []
+        tag_counts, category_counts, price_counts = Counter(), Counter(), Counter()
+        for course, (_, tag_names, category_names) in zip(courses, rows):
+            for tag_id in {tags[name] for name in tag_names}:
+                tagged_items.append(Course.tags.through(content_type=self.content_type, object_id=course.id,
+                                                        tag_id=tag_id))
+                tag_counts[tag_id] += 1
+            for category_id in {categories[name] for name in category_names}:
+                course_categories.append(Course.category.through(course_id=course.id, category_id=category_id))
+                category_counts[category_id] += 1
+            price_counts[price_band(course.price)] += 1
+        Course.tags.through.objects.bulk_create(tagged_items)
+        Course.category.through.objects.bulk_create(course_categories)
+
+        # сигналы при bulk_create не срабатывают, счётчики тегов и фасетов обновляем сами
+        by_delta = {}
+        for tag_id, delta in tag_counts.items():
+            by_delta.setdefault(delta, []).append(tag_id)
+        for delta, tag_ids in by_delta.items():
+            TagCount.objects.adjust(tag_ids, delta)
+        FacetCount.objects.adjust_many(FacetCount.CATEGORY, category_counts)
+        FacetCount.objects.adjust_many(FacetCount.PRICE, price_counts)
+        refresh_course_cards([course.id for course in courses])
+
+        tag_slugs = Tag.objects.filter(id__in=tag_counts).values_list('slug', flat=True)
+        invalidate([CATALOG_NAMESPACE, CATEGORIES_NAMESPACE] + [tag_namespace(slug) for slug in tag_slugs])
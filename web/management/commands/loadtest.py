@@ -0,0 +1,79 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def fetch(url):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n' % (path, parts.netloc)).encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def run_load(url, total, concurrency):
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                status = await fetch(url)
+            except (OSError, IndexError, ValueError):
+                status = None
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон уже запущенных серверов: считает запросы в секунду и перцентили задержки. '
+            'Пример сравнения WSGI и ASGI: '
+            'manage.py loadtest wsgi=http://127.0.0.1:8000/stepok/ asgi=http://127.0.0.1:8001/stepok/')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='имя=URL или просто URL')
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждую цель')
+        parser.add_argument('--concurrency', type=int, default=200, help='Одновременных соединений')
+        parser.add_argument('--warmup', type=int, default=50, help='Запросов на прогрев перед замером')
+
+    def handle(self, *args, **options):
+        rows = []
+        for target in options['targets']:
+            label, sep, url = target.partition('=')
+            if not sep or '://' in label:
+                label, url = target, target
+            if not url.startswith('http://'):
+                raise CommandError('Поддерживается только http://: %s' % url)
+            asyncio.run(run_load(url, options['warmup'], min(options['warmup'], options['concurrency'])))
+            latencies, errors, elapsed = asyncio.run(run_load(url, options['requests'], options['concurrency']))
+            rows.append((label, len(latencies), errors, len(latencies) / elapsed,
+                         percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+
+        self.stdout.write('%-24s %8s %7s %9s %9s %9s %9s' % ('target', 'requests', 'errors', 'req/s',
+                                                             'p50 ms', 'p95 ms', 'p99 ms'))
+        for label, count, errors, rps, p50, p95, p99 in rows:
+            self.stdout.write('%-24s %8d %7d %9.1f %9.1f %9.1f %9.1f' % (label, count, errors, rps,
+                                                                         p50 * 1000, p95 * 1000, p99 * 1000))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from web.models import CoursePurge
+from web.purge import PURGE_CHUNK_SIZE, purge_course
+
+
+class Command(BaseCommand):
+    help = ('Дочищает удалённые курсы: комментарии, просмотры и связи пачками, затем сам курс. '
+            'Подхватывает очистки, прерванные перезапуском процесса или упавшие с ошибкой')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        purges = CoursePurge.objects.exclude(state=CoursePurge.DONE).order_by('created_at')
+        for purge_id in purges.values_list('id', flat=True):
+            purge = purge_course(purge_id, chunk_size=options['chunk_size'])
+            self.stdout.write('Курс %s «%s»: удалено строк %d' % (purge.course_id, purge.title, purge.deleted_rows))
+        self.stdout.write(self.style.SUCCESS('Готово'))
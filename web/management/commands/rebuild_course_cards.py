@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from web.cache import CATALOG_NAMESPACE, bump_versions
+from web.cards import REBUILD_BATCH_SIZE, rebuild_course_cards
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает карточки курсов для сеток каталога, если они разошлись с данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = rebuild_course_cards(batch_size=options['batch_size'])
+        bump_versions([CATALOG_NAMESPACE])
+        self.stdout.write(self.style.SUCCESS('Пересобрано карточек: %d' % total))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from web.facets import PRICE_BANDS, price_band_q
+from web.models import Course, FacetCount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики фасетов каталога (категории и ценовые диапазоны) по всем курсам'
+
+    def handle(self, *args, **options):
+        categories = (
+            Course.category.through.objects
+            .values('category_id')
+            .annotate(count=Count('id'))
+            .values_list('category_id', 'count')
+        )
+        prices = Course.objects.aggregate(**{
+            key: Count('pk', filter=price_band_q(key)) for key, _, _, _ in PRICE_BANDS
+        })
+        with transaction.atomic():
+            FacetCount.objects.all().delete()
+            FacetCount.objects.bulk_create(
+                [FacetCount(facet=FacetCount.CATEGORY, value=str(category_id), count=count)
+                 for category_id, count in categories]
+                + [FacetCount(facet=FacetCount.PRICE, value=key, count=count)
+                   for key, count in prices.items() if count]
+            )
+        self.stdout.write(self.style.SUCCESS('Пересчитано значений фасетов: %d' % FacetCount.objects.count()))
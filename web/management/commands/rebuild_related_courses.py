@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.cache import RELATED_NAMESPACE, invalidate
+from web.recommendations import rebuild_all
+
+
+class Command(BaseCommand):
+    help = ('Полностью пересчитывает похожие курсы по общим тегам и категориям. '
+            'Запускать после массового импорта: incremental-обновление работает только по сигналам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = rebuild_all(batch_size=options['batch_size'])
+        invalidate([RELATED_NAMESPACE])
+        self.stdout.write(self.style.SUCCESS('Записано связей: %d за %.1f с' % (written, time.perf_counter() - start)))
@@ -0,0 +1,26 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from web.models import Course, TagCount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу популярности тегов по всем курсам'
+
+    def handle(self, *args, **options):
+        counts = (
+            Course.tags.through.objects
+            .filter(content_type=ContentType.objects.get_for_model(Course))
+            .values('tag_id')
+            .annotate(count=Count('id'))
+            .values_list('tag_id', 'count')
+        )
+        with transaction.atomic():
+            TagCount.objects.all().delete()
+            TagCount.objects.bulk_create(
+                (TagCount(tag_id=tag_id, count=count) for tag_id, count in counts.iterator()),
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS('Пересчитано тегов: %d' % TagCount.objects.count()))
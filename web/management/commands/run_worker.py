@@ -0,0 +1,46 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from web.tasks import Worker
+
+
+def run(burst):
+    worker = Worker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run(burst=burst)
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди web_task: превью картинок, пересчёт похожих курсов, '
+            'дочистку удалённых курсов. По SIGTERM доделывает текущие задачи и выходит')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='сколько процессов-воркеров запустить')
+        parser.add_argument('--burst', action='store_true', help='выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            run(options['burst'])
+            return
+
+        # соединения родителя не должны достаться дочерним процессам
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=run, args=(options['burst'],)) for _ in range(options['processes'])]
+        for process in workers:
+            process.start()
+
+        def stop(*args):
+            for process in workers:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        # Ctrl+C терминал и так шлёт всей группе процессов
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for process in workers:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены'))
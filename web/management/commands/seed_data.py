@@ -0,0 +1,102 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.text import slugify
+
+from web.cards import refresh_course_cards
+from web.management.commands.import_courses import Command as ImportCommand
+from web.models import Comment, Course, User, UserInfo
+
+WORDS = ('python', 'django', 'данные', 'алгоритмы', 'дизайн', 'маркетинг', 'математика', 'физика', 'английский',
+         'история', 'базы', 'сети', 'безопасность', 'графика', 'музыка', 'финансы', 'статистика', 'химия')
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу правдоподобным объёмом данных для нагрузочных прогонов: пользователи с анкетами, '
+            'курсы с тегами и категориями, комментарии')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--courses', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=150)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--prefix', default='seed', help='Префикс имён пользователей, тегов и категорий')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора, чтобы прогоны были повторяемыми')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+
+        user_ids = self.create_users(prefix, options['users'], batch_size)
+        tag_names = ['%s-%s-%d' % (prefix, self.random.choice(WORDS), i) for i in range(options['tags'])]
+        category_names = ['%s %s %d' % (prefix.title(), self.random.choice(WORDS), i)
+                          for i in range(options['categories'])]
+
+        course_ids = self.create_courses(user_ids, tag_names, category_names, options['courses'], batch_size)
+        self.create_comments(user_ids, course_ids, options['comments'], batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            'Создано пользователей: %d, курсов: %d, комментариев: %d'
+            % (len(user_ids), len(course_ids), options['comments'] if course_ids else 0)
+        ))
+
+    @transaction.atomic
+    def create_users(self, prefix, count, batch_size):
+        # хешировать пароль для каждого пользователя слишком долго, у всех он одинаковый
+        password = make_password(prefix)
+        existing = set(User.objects.filter(username__startswith=prefix + '-').values_list('username', flat=True))
+        users = [User(username='%s-%d' % (prefix, i), email='%s-%d@example.com' % (prefix, i), password=password)
+                 for i in range(count) if '%s-%d' % (prefix, i) not in existing]
+        users = User.objects.bulk_create(users, batch_size=batch_size)
+        UserInfo.objects.bulk_create([
+            UserInfo(user=user, name=user.username, bio=self.text(30)) for user in users
+        ], batch_size=batch_size)
+        return list(User.objects.filter(username__startswith=prefix + '-').values_list('id', flat=True))
+
+    def create_courses(self, user_ids, tag_names, category_names, count, batch_size):
+        # пачки сохраняет импорт, он же обновляет счётчики тегов и кеш каталога
+        importer = ImportCommand()
+        importer.content_type = ContentType.objects.get_for_model(Course)
+        course_ids = []
+        for start in range(0, count, batch_size):
+            rows = []
+            for i in range(start, min(start + batch_size, count)):
+                title = '%s %d' % (self.random.choice(WORDS).capitalize(), i)
+                course = Course(user_id=self.random.choice(user_ids), title=title,
+                                slug=slugify(title, allow_unicode=True), text=self.text(80),
+                                price=self.random.choice([None, 500, 1500, 5000, 12000, 30000]))
+                rows.append((course, self.sample(tag_names, 1, 5), self.sample(category_names, 1, 2)))
+            importer.import_batch(rows)
+            course_ids.extend(course.id for course, _, _ in rows)
+        return course_ids
+
+    @transaction.atomic
+    def create_comments(self, user_ids, course_ids, count, batch_size):
+        if not course_ids:
+            return
+        # у популярных курсов комментариев заметно больше, как в жизни
+        weights = [1 / (rank + 1) for rank in range(len(course_ids))]
+        commented = self.random.choices(course_ids, weights=weights, k=count)
+        for start in range(0, count, batch_size):
+            Comment.objects.bulk_create([
+                Comment(course_id=course_id, user_id=self.random.choice(user_ids), text=self.text(20))
+                for course_id in commented[start:start + batch_size]
+            ])
+        # сигналы при bulk_create не срабатывают, счётчик пересчитываем одним запросом
+        counts = Comment.objects.filter(course=OuterRef('pk')).order_by().values('course').annotate(
+            total=Count('pk')).values('total')
+        Course.objects.filter(id__in=set(commented)).update(comment_count=Coalesce(Subquery(counts), 0))
+        refresh_course_cards(commented)
+
+    def sample(self, population, low, high):
+        return self.random.sample(population, min(len(population), self.random.randint(low, high)))
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words))
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+from web.routers import RoutingState, current_routing, replica_enabled
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+logger = logging.getLogger('web.requests')
+slow_logger = logging.getLogger('web.slow_requests')
+
+# для медленного запроса в лог попадает не больше стольких SQL
+MAX_SAMPLED_QUERIES = 200
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.queries = []
+        self.count = 0
+        self.executed = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # обёртка для connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.db_time += duration
+            self.count += 1
+            self.executed[(sql, repr(params))] += 1
+            if len(self.queries) < MAX_SAMPLED_QUERIES:
+                self.queries.append({'sql': sql, 'params': repr(params), 'ms': round(duration * 1000, 2)})
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.executed.values())
+
+    def most_repeated(self):
+        # один и тот же SQL с разными параметрами много раз подряд — обычно N+1
+        templates = Counter()
+        for (sql, _), count in self.executed.items():
+            templates[sql] += count
+        return templates.most_common(1)[0] if templates else (None, 0)
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.render_time += time.perf_counter() - start
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """
+    Обычный бэкенд шаблонов, который засчитывает время отрисовки в статистику текущего запроса.
+    Вложенные {% include %} идут мимо бэкенда, поэтому время не считается дважды.
+    """
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name).template, self)
+
+
+class RequestProfilingMiddleware:
+    """
+    Считает запросы к БД, их повторы, время в БД и время отрисовки шаблонов.
+    Отдаёт их в заголовке Server-Timing и строкой JSON в лог web.requests,
+    медленные запросы (WEB_SLOW_REQUEST_MS) с их SQL — в web.slow_requests.
+    Включается WEB_PROFILE_REQUESTS, иначе Django его не подключает.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.WEB_PROFILE_REQUESTS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats, token, start = self.start()
+        try:
+            with self.wrap_connections(stats):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats, token, start = self.start()
+        # соединения с БД у каждого потока свои, ORM из async-кода ходит через поток sync_to_async
+        stack = await sync_to_async(self.wrap_connections)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            current_stats.reset(token)
+        return self.finish(request, response, stats, start)
+
+    def start(self):
+        stats = RequestStats()
+        return stats, current_stats.set(stats), time.perf_counter()
+
+    def wrap_connections(self, stats):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        return stack
+
+    def finish(self, request, response, stats, start):
+        total = (time.perf_counter() - start) * 1000
+        db, render = stats.db_time * 1000, stats.render_time * 1000
+        response['Server-Timing'] = ', '.join([
+            'db;dur=%.1f;desc="%d queries, %d duplicates"' % (db, stats.count, stats.duplicates),
+            'render;dur=%.1f' % render,
+            'app;dur=%.1f' % max(total - db - render, 0),
+            'total;dur=%.1f' % total,
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        repeated_sql, repeated = stats.most_repeated()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total, 1),
+            'db_ms': round(db, 1),
+            'render_ms': round(render, 1),
+            'queries': stats.count,
+            'duplicates': stats.duplicates,
+            'most_repeated': repeated,
+        }
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+        if total >= settings.WEB_SLOW_REQUEST_MS and random.random() < settings.WEB_SLOW_REQUEST_SAMPLE_RATE:
+            slow_logger.warning(json.dumps(
+                {**record, 'most_repeated_sql': repeated_sql, 'sql': stats.queries}, ensure_ascii=False,
+            ))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Отправляет чтение на реплику для GET/HEAD к представлениям с атрибутом replica_reads.
+    После любого изменяющего запроса ставит куку, и пока она жива, чтение пользователя
+    идёт в основную базу — так он сразу видит свои изменения, даже если реплика отстаёт.
+    Без базы replica в DATABASES не подключается.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = current_routing.set(RoutingState())
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.pin_after_write(request, response)
+
+    async def __acall__(self, request):
+        token = current_routing.set(RoutingState())
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.pin_after_write(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if (request.method in ('GET', 'HEAD') and getattr(view, 'replica_reads', False)
+                and settings.WEB_PRIMARY_PIN_COOKIE not in request.COOKIES):
+            current_routing.get().use_replica = True
+
+    def pin_after_write(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(settings.WEB_PRIMARY_PIN_COOKIE, '1', max_age=settings.WEB_PRIMARY_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['-created_date', '-id'], name='course_created_id_idx'),
+        ),
+    ]
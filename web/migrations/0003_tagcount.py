@@ -0,0 +1,48 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_tag_counts(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    TagCount = apps.get_model('web', 'TagCount')
+    content_type = ContentType.objects.filter(app_label='web', model='course').first()
+    if content_type is None:
+        return
+    counts = (
+        TaggedItem.objects.filter(content_type=content_type)
+        .values('tag_id')
+        .annotate(count=models.Count('id'))
+        .values_list('tag_id', 'count')
+    )
+    TagCount.objects.bulk_create([TagCount(tag_id=tag_id, count=count) for tag_id, count in counts])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0005_auto_20220424_2025'),
+        ('web', '0002_course_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='course_count', serialize=False, to='taggit.tag', verbose_name='тег')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='количество курсов')),
+            ],
+            options={
+                'verbose_name': 'Популярность тега',
+                'verbose_name_plural': 'Популярность тегов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tagcount',
+            index=models.Index(fields=['-count'], name='tagcount_count_idx'),
+        ),
+        migrations.RunPython(fill_tag_counts, migrations.RunPython.noop),
+    ]
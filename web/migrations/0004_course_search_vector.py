@@ -0,0 +1,51 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:37
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Заголовок весит больше описания; русская и английская морфология
+# складываются в один вектор, так как курсы бывают на обоих языках.
+CREATE_TRIGGER = '''
+CREATE FUNCTION web_course_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.russian', coalesce(NEW.text, '')), 'B') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.text, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER web_course_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, text ON web_course
+    FOR EACH ROW EXECUTE FUNCTION web_course_search_vector_update();
+
+UPDATE web_course SET title = title;
+'''
+
+DROP_TRIGGER = '''
+DROP TRIGGER IF EXISTS web_course_search_vector_trigger ON web_course;
+DROP FUNCTION IF EXISTS web_course_search_vector_update();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0003_tagcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='course_search_vector_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
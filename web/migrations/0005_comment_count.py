@@ -0,0 +1,37 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:37
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_counts(apps, schema_editor):
+    Course = apps.get_model('web', 'Course')
+    Comment = apps.get_model('web', 'Comment')
+    counts = (
+        Comment.objects.filter(course=models.OuterRef('pk'))
+        .order_by()
+        .values('course')
+        .annotate(count=models.Count('id'))
+        .values('count')
+    )
+    Course.objects.update(comment_count=Coalesce(models.Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0004_course_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='количество комментариев'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['course', '-create_date'], name='comment_course_created_idx'),
+        ),
+        migrations.RunPython(fill_comment_counts, migrations.RunPython.noop),
+    ]
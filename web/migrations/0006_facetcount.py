@@ -0,0 +1,65 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+# копия web.facets.PRICE_BANDS на момент миграции
+PRICE_BANDS = [
+    ('none', None, None),
+    ('lt-1000', None, 1000),
+    ('1000-5000', 1000, 5000),
+    ('5000-20000', 5000, 20000),
+    ('20000+', 20000, None),
+]
+
+
+def fill_facet_counts(apps, schema_editor):
+    Course = apps.get_model('web', 'Course')
+    FacetCount = apps.get_model('web', 'FacetCount')
+    rows = [
+        FacetCount(facet='category', value=str(category_id), count=count)
+        for category_id, count in Course.category.through.objects.values('category_id').annotate(
+            count=models.Count('id')).values_list('category_id', 'count')
+    ]
+    bands = {}
+    for key, low, high in PRICE_BANDS:
+        q = models.Q(price__isnull=True) if key == 'none' else models.Q(price__isnull=False)
+        if low is not None:
+            q &= models.Q(price__gte=low)
+        if high is not None:
+            q &= models.Q(price__lt=high)
+        bands[key] = models.Count('pk', filter=q)
+    rows += [FacetCount(facet='price', value=key, count=count)
+             for key, count in Course.objects.aggregate(**bands).items() if count]
+    FacetCount.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0005_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'категория'), ('price', 'цена')], max_length=16, verbose_name='фасет')),
+                ('value', models.CharField(max_length=32, verbose_name='значение')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='количество курсов')),
+            ],
+            options={
+                'verbose_name': 'Счётчик фасета',
+                'verbose_name_plural': 'Счётчики фасетов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['price'], name='course_price_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(fields=('facet', 'value'), name='facetcount_facet_value_uniq'),
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
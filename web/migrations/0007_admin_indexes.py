@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:54
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0006_facetcount'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-create_date'], name='comment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('username', models.TextField())), name='text_pattern_ops'), name='user_username_upper_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0007_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedCourse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='сходство')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='web.course', verbose_name='курс')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='web.course', verbose_name='похожий курс')),
+            ],
+            options={
+                'verbose_name': 'Похожий курс',
+                'verbose_name_plural': 'Похожие курсы',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='relatedcourse',
+            index=models.Index(fields=['course', '-score'], name='relatedcourse_course_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='relatedcourse',
+            constraint=models.UniqueConstraint(fields=('course', 'related'), name='relatedcourse_course_related_uniq'),
+        ),
+    ]
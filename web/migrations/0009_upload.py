@@ -0,0 +1,32 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0008_relatedcourse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='имя файла')),
+                ('size', models.PositiveBigIntegerField(verbose_name='размер')),
+                ('received', models.PositiveBigIntegerField(default=0, verbose_name='получено байт')),
+                ('completed', models.BooleanField(default=False, verbose_name='завершена')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создана')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'Загрузка',
+                'verbose_name_plural': 'Загрузки',
+            },
+        ),
+    ]
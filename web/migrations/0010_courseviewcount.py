@@ -0,0 +1,35 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0009_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseViewCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='просмотры')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_counts', to='web.course', verbose_name='курс')),
+            ],
+            options={
+                'verbose_name': 'Просмотры курса за день',
+                'verbose_name_plural': 'Просмотры курсов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='courseviewcount',
+            index=models.Index(fields=['day'], name='courseviewcount_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='courseviewcount',
+            constraint=models.UniqueConstraint(fields=('course', 'day'), name='courseviewcount_course_day_uniq'),
+        ),
+    ]
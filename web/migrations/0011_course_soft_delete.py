@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0010_courseviewcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoursePurge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_id', models.BigIntegerField(unique=True, verbose_name='id курса')),
+                ('title', models.CharField(max_length=50, verbose_name='название курса')),
+                ('state', models.CharField(choices=[('pending', 'в очереди'), ('running', 'выполняется'), ('done', 'завершено'), ('failed', 'ошибка')], default='pending', max_length=16, verbose_name='состояние')),
+                ('stage', models.CharField(blank=True, max_length=32, verbose_name='текущий шаг')),
+                ('total_rows', models.PositiveBigIntegerField(default=0, verbose_name='строк к удалению (оценка)')),
+                ('deleted_rows', models.PositiveBigIntegerField(default=0, verbose_name='удалено строк')),
+                ('error', models.TextField(blank=True, verbose_name='ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='завершено')),
+            ],
+            options={
+                'verbose_name': 'Очистка удалённого курса',
+                'verbose_name_plural': 'Очистки удалённых курсов',
+            },
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='удалён'),
+        ),
+        # без статистики по новому столбцу планировщик считает, что под deleted_at IS NULL
+        # почти ничего не попадает, и читает всю таблицу вместо индекса course_created_id_idx
+        migrations.RunSQL('ANALYZE web_course', migrations.RunSQL.noop),
+    ]
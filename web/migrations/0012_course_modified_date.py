@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0011_course_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='modified_date',
+            field=models.DateTimeField(auto_now=True, verbose_name='изменён'),
+        ),
+        # у существующих курсов дата изменения неизвестна, считаем её датой создания
+        migrations.RunSQL('UPDATE web_course SET modified_date = created_date', migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0012_course_modified_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='задача')),
+                ('args', models.JSONField(blank=True, default=list, verbose_name='аргументы')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='именованные аргументы')),
+                ('key', models.CharField(blank=True, max_length=200, verbose_name='ключ')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='приоритет')),
+                ('state', models.CharField(choices=[('queued', 'в очереди'), ('running', 'выполняется'), ('failed', 'ошибка')], default='queued', max_length=16, verbose_name='состояние')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='попыток')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3, verbose_name='максимум попыток')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='запустить не раньше')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='взята воркером')),
+                ('worker', models.CharField(blank=True, max_length=64, verbose_name='воркер')),
+                ('error', models.TextField(blank=True, verbose_name='ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создана')),
+            ],
+            options={
+                'verbose_name': 'Фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('state', 'queued')), fields=['-priority', 'run_at', 'id'], name='task_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('state', 'running')), fields=['locked_at'], name='task_running_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('state', 'queued'), models.Q(('key', ''), _negated=True)), fields=('key',), name='task_queued_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:16
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# первое заполнение карточек; дальше их ведёт web.cards
+FILL_CARDS_SQL = '''
+    INSERT INTO web_coursecard (id, author_id, author_name, slug, title, price, image, summary,
+                                tag_slugs, tag_names, category_names, comment_count, created_date)
+    SELECT course.id, course.user_id, author.username, course.slug, course.title, course.price, course.image,
+           LEFT(course.text, 300),
+           COALESCE(tags.slugs, '{}'), COALESCE(tags.names, '{}'), COALESCE(categories.names, '{}'),
+           course.comment_count, course.created_date
+    FROM web_course course
+    JOIN web_user author ON author.id = course.user_id
+    LEFT JOIN LATERAL (
+        SELECT array_agg(tag.slug ORDER BY tag.name, tag.id) AS slugs,
+               array_agg(tag.name ORDER BY tag.name, tag.id) AS names
+        FROM taggit_taggeditem item JOIN taggit_tag tag ON tag.id = item.tag_id
+        WHERE item.object_id = course.id
+          AND item.content_type_id = (SELECT id FROM django_content_type WHERE app_label = 'web' AND model = 'course')
+    ) tags ON true
+    LEFT JOIN LATERAL (
+        SELECT array_agg(category.name ORDER BY category.name) AS names
+        FROM web_course_category link JOIN web_category category ON category.id = link.category_id
+        WHERE link.course_id = course.id
+    ) categories ON true
+    WHERE course.deleted_at IS NULL
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0013_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseCard',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='id курса')),
+                ('author_id', models.BigIntegerField(db_index=True, verbose_name='id автора')),
+                ('author_name', models.CharField(max_length=150, verbose_name='автор')),
+                ('slug', models.SlugField(max_length=250, verbose_name='слаг')),
+                ('title', models.CharField(max_length=50, verbose_name='название')),
+                ('price', models.IntegerField(blank=True, null=True, verbose_name='цена')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='image_courses', verbose_name='картинка')),
+                ('summary', models.TextField(blank=True, verbose_name='начало описания')),
+                ('tag_slugs', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None, verbose_name='слаги тегов')),
+                ('tag_names', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None, verbose_name='теги')),
+                ('category_names', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=64), blank=True, default=list, size=None, verbose_name='категории')),
+                ('comment_count', models.PositiveIntegerField(default=0, verbose_name='количество комментариев')),
+                ('created_date', models.DateTimeField(verbose_name='создан')),
+            ],
+            options={
+                'verbose_name': 'Карточка курса',
+                'verbose_name_plural': 'Карточки курсов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='coursecard',
+            index=models.Index(fields=['-created_date', '-id'], name='coursecard_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursecard',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tag_slugs'], name='coursecard_tag_slugs_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursecard',
+            index=models.Index(fields=['price'], name='coursecard_price_idx'),
+        ),
+        migrations.RunSQL(FILL_CARDS_SQL, migrations.RunSQL.noop),
+        migrations.RunSQL('ANALYZE web_coursecard', migrations.RunSQL.noop),
+    ]
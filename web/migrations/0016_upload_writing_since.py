@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0015_course_title_upper_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='writing_since',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='кусок пишется с'),
+        ),
+    ]
@@ -1,12 +1,36 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchQuery, SearchVectorField
+from django.db.models import F, Q, Value
+from django.db.models.functions import Cast, Greatest, Upper
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from taggit.managers import TaggableManager
+from taggit.models import Tag
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
 class User(AbstractUser):
     image = models.ImageField(upload_to='users_avatars', blank=True, null=True)
 
+    def get_session_auth_hash(self):
+        # пользователь из кеша web.backends приходит без пароля, но с готовым хешем сессии
+        if 'password' in self.get_deferred_fields() and '_session_auth_hash' in self.__dict__:
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # под поиск в админке и автодополнение: istartswith/iexact сравнивают UPPER(username::text)
+            models.Index(OpClass(Upper(Cast('username', models.TextField())), name='text_pattern_ops'),
+                         name='user_username_upper_idx'),
+        ]
+
 
 class UserInfo(models.Model):
     user = models.ForeignKey(User, related_name='user_info', verbose_name='пользователь', on_delete=models.CASCADE)
@@ -32,6 +56,18 @@ class Category(models.Model):
         return self.name
 
 
+def course_search_query(text):
+    # search_vector собран из русской и английской конфигураций, запрос строим в обеих
+    return (SearchQuery(text, config='russian', search_type='websearch') |
+            SearchQuery(text, config='english', search_type='websearch'))
+
+
+class CourseManager(models.Manager):
+    # удалённый курс (deleted_at) не виден нигде, кроме all_objects; строки дочищает web.purge
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Course(models.Model):
     user = models.ForeignKey(User, verbose_name='пользователь', related_name='user_courses', on_delete=models.CASCADE)
     tags = TaggableManager()
@@ -39,18 +75,71 @@ class Course(models.Model):
                                 validators=[MinValueValidator(1), MaxValueValidator(150000)])
     title = models.CharField(max_length=50, verbose_name='название')
     created_date = models.DateTimeField(auto_now_add=True)
+    # сайтмапы перестраивают только шарды, где что-то поменялось после прошлой сборки
+    modified_date = models.DateTimeField(auto_now=True, verbose_name='изменён')
     slug = models.SlugField(max_length=250, verbose_name='слаг', unique_for_date='created_date')
     text = models.TextField(verbose_name='описание')
     image = models.ImageField(null=True, blank=True, upload_to='image_courses', verbose_name='картинка')
     category = models.ManyToManyField(Category)
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='количество комментариев')
+    # заполняется триггером web_course_search_vector_trigger, см. миграцию 0004
+    search_vector = SearchVectorField(null=True, editable=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='удалён')
+
+    objects = CourseManager()
+    all_objects = models.Manager()
 
     class Meta:
         verbose_name_plural = 'Курсы'
         verbose_name = 'Курс'
+        indexes = [
+            models.Index(fields=['-created_date', '-id'], name='course_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='course_search_vector_idx'),
+            models.Index(fields=['price'], name='course_price_idx'),
+            # автодополнение курса в админке: istartswith сравнивает UPPER(title::text)
+            models.Index(OpClass(Upper(Cast('title', models.TextField())), name='text_pattern_ops'),
+                         name='course_title_upper_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class CourseCard(models.Model):
+    """
+    Карточка курса для сеток каталога: всё, что показывает course_card.html, уже собрано в одну строку.
+    Строки пересобирает web.cards из сигналов, id совпадает с id курса.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='id курса')
+    author_id = models.BigIntegerField(db_index=True, verbose_name='id автора')
+    author_name = models.CharField(max_length=150, verbose_name='автор')
+    slug = models.SlugField(max_length=250, verbose_name='слаг')
+    title = models.CharField(max_length=50, verbose_name='название')
+    price = models.IntegerField(null=True, blank=True, verbose_name='цена')
+    image = models.ImageField(null=True, blank=True, upload_to='image_courses', verbose_name='картинка')
+    summary = models.TextField(blank=True, verbose_name='начало описания')
+    tag_slugs = ArrayField(models.CharField(max_length=100), default=list, blank=True, verbose_name='слаги тегов')
+    tag_names = ArrayField(models.CharField(max_length=100), default=list, blank=True, verbose_name='теги')
+    category_names = ArrayField(models.CharField(max_length=64), default=list, blank=True, verbose_name='категории')
+    comment_count = models.PositiveIntegerField(default=0, verbose_name='количество комментариев')
+    created_date = models.DateTimeField(verbose_name='создан')
+
+    class Meta:
+        verbose_name_plural = 'Карточки курсов'
+        verbose_name = 'Карточка курса'
+        indexes = [
+            models.Index(fields=['-created_date', '-id'], name='coursecard_created_id_idx'),
+            GinIndex(fields=['tag_slugs'], name='coursecard_tag_slugs_idx'),
+            models.Index(fields=['price'], name='coursecard_price_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def tags(self):
+        return [{'slug': slug, 'name': name} for slug, name in zip(self.tag_slugs, self.tag_names)]
+
 
 class Comment(models.Model):
     course = models.ForeignKey(Course, verbose_name='курс', related_name='course_comments', on_delete=models.CASCADE)
@@ -61,3 +150,226 @@ class Comment(models.Model):
     class Meta:
         verbose_name_plural = 'Комментарии'
         verbose_name = 'Комментарий'
+        indexes = [
+            models.Index(fields=['course', '-create_date'], name='comment_course_created_idx'),
+            models.Index(fields=['-create_date'], name='comment_created_idx'),
+        ]
+
+
+class TagCountQuerySet(models.QuerySet):
+    def _most_common(self, limit):
+        return self.filter(count__gt=0).select_related('tag').order_by('-count')[:limit]
+
+    def most_common(self, limit):
+        return [tag_count.tag for tag_count in self._most_common(limit)]
+
+    async def amost_common(self, limit):
+        return [tag_count.tag async for tag_count in self._most_common(limit)]
+
+    def adjust(self, tag_ids, delta):
+        if not tag_ids:
+            return
+        self.bulk_create([TagCount(tag_id=tag_id) for tag_id in tag_ids], ignore_conflicts=True)
+        self.filter(tag_id__in=tag_ids).update(count=Greatest(F('count') + delta, Value(0)))
+
+
+class TagCount(models.Model):
+    tag = models.OneToOneField(Tag, primary_key=True, related_name='course_count', on_delete=models.CASCADE,
+                               verbose_name='тег')
+    count = models.PositiveIntegerField(default=0, verbose_name='количество курсов')
+
+    objects = TagCountQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'Популярность тегов'
+        verbose_name = 'Популярность тега'
+        indexes = [
+            models.Index(fields=['-count'], name='tagcount_count_idx'),
+        ]
+
+
+class FacetCountQuerySet(models.QuerySet):
+    def counts(self, facet):
+        return dict(self.filter(facet=facet).values_list('value', 'count'))
+
+    def adjust(self, facet, values, delta):
+        values = [str(value) for value in values]
+        if not values:
+            return
+        self.bulk_create([FacetCount(facet=facet, value=value) for value in values], ignore_conflicts=True)
+        self.filter(facet=facet, value__in=values).update(count=Greatest(F('count') + delta, Value(0)))
+
+    def adjust_many(self, facet, deltas):
+        # одна пара запросов на каждую разную величину изменения, а не на каждое значение
+        by_delta = {}
+        for value, delta in deltas.items():
+            if delta:
+                by_delta.setdefault(delta, []).append(value)
+        for delta, values in by_delta.items():
+            self.adjust(facet, values, delta)
+
+
+class FacetCount(models.Model):
+    CATEGORY = 'category'
+    PRICE = 'price'
+    FACET_CHOICES = [
+        (CATEGORY, 'категория'),
+        (PRICE, 'цена'),
+    ]
+
+    facet = models.CharField(max_length=16, choices=FACET_CHOICES, verbose_name='фасет')
+    # id категории или ключ ценового диапазона из web.facets.PRICE_BANDS
+    value = models.CharField(max_length=32, verbose_name='значение')
+    count = models.PositiveIntegerField(default=0, verbose_name='количество курсов')
+
+    objects = FacetCountQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'Счётчики фасетов'
+        verbose_name = 'Счётчик фасета'
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='facetcount_facet_value_uniq'),
+        ]
+
+
+class RelatedCourseQuerySet(models.QuerySet):
+    def _top_for(self, course_id, limit):
+        return (
+            self.filter(course_id=course_id, related__deleted_at__isnull=True)
+            .select_related('related')
+            .only('related__id', 'related__title', 'related__slug', 'related__price', 'related__image')
+            .order_by('-score')[:limit]
+        )
+
+    def top_for(self, course_id, limit):
+        return [link.related for link in self._top_for(course_id, limit)]
+
+    async def atop_for(self, course_id, limit):
+        return [link.related async for link in self._top_for(course_id, limit)]
+
+
+class RelatedCourse(models.Model):
+    # заполняется web.recommendations: пакетно командой rebuild_related_courses и по сигналам при смене тегов
+    course = models.ForeignKey(Course, related_name='related_links', on_delete=models.CASCADE, verbose_name='курс')
+    related = models.ForeignKey(Course, related_name='+', on_delete=models.CASCADE, verbose_name='похожий курс')
+    score = models.FloatField(verbose_name='сходство')
+
+    objects = RelatedCourseQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'Похожие курсы'
+        verbose_name = 'Похожий курс'
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'related'], name='relatedcourse_course_related_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['course', '-score'], name='relatedcourse_course_score_idx'),
+        ]
+
+
+class CourseViewCount(models.Model):
+    # пишется пачками из буфера web.popularity, а не по строке на просмотр
+    course = models.ForeignKey(Course, related_name='view_counts', on_delete=models.CASCADE, verbose_name='курс')
+    day = models.DateField(verbose_name='день')
+    views = models.PositiveIntegerField(default=0, verbose_name='просмотры')
+
+    class Meta:
+        verbose_name_plural = 'Просмотры курсов'
+        verbose_name = 'Просмотры курса за день'
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'day'], name='courseviewcount_course_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='courseviewcount_day_idx'),
+        ]
+
+
+class CoursePurge(models.Model):
+    """Фоновое удаление строк, зависящих от удалённого курса, пачками (web.purge)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (DONE, 'завершено'),
+        (FAILED, 'ошибка'),
+    ]
+
+    # не внешний ключ: сам курс удаляется последним шагом
+    course_id = models.BigIntegerField(unique=True, verbose_name='id курса')
+    title = models.CharField(max_length=50, verbose_name='название курса')
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=PENDING, verbose_name='состояние')
+    stage = models.CharField(max_length=32, blank=True, verbose_name='текущий шаг')
+    total_rows = models.PositiveBigIntegerField(default=0, verbose_name='строк к удалению (оценка)')
+    deleted_rows = models.PositiveBigIntegerField(default=0, verbose_name='удалено строк')
+    error = models.TextField(blank=True, verbose_name='ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='создано')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='завершено')
+
+    class Meta:
+        verbose_name_plural = 'Очистки удалённых курсов'
+        verbose_name = 'Очистка удалённого курса'
+
+
+class Upload(models.Model):
+    """Загрузка картинки по кускам: куски дописываются во временный файл, пока received не дойдёт до size."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='uploads', on_delete=models.CASCADE, verbose_name='пользователь')
+    filename = models.CharField(max_length=255, verbose_name='имя файла')
+    size = models.PositiveBigIntegerField(verbose_name='размер')
+    received = models.PositiveBigIntegerField(default=0, verbose_name='получено байт')
+    completed = models.BooleanField(default=False, verbose_name='завершена')
+    writing_since = models.DateTimeField(null=True, blank=True, verbose_name='кусок пишется с')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='создана')
+
+    class Meta:
+        verbose_name_plural = 'Загрузки'
+        verbose_name = 'Загрузка'
+
+    @property
+    def path(self):
+        return os.path.join(settings.WEB_UPLOAD_TEMP_DIR, '%s.part' % self.id)
+
+
+class Task(models.Model):
+    """Фоновая задача очереди web.tasks; выполняет её воркер run_worker, удачно выполненные удаляются."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (QUEUED, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (FAILED, 'ошибка'),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name='задача')
+    args = models.JSONField(default=list, blank=True, verbose_name='аргументы')
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name='именованные аргументы')
+    # пока задача с таким ключом ждёт в очереди, вторая такая же не ставится
+    key = models.CharField(max_length=200, blank=True, verbose_name='ключ')
+    priority = models.SmallIntegerField(default=0, verbose_name='приоритет')
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=QUEUED, verbose_name='состояние')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='попыток')
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name='максимум попыток')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='запустить не раньше')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='взята воркером')
+    worker = models.CharField(max_length=64, blank=True, verbose_name='воркер')
+    error = models.TextField(blank=True, verbose_name='ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='создана')
+
+    class Meta:
+        verbose_name_plural = 'Фоновые задачи'
+        verbose_name = 'Фоновая задача'
+        indexes = [
+            models.Index(fields=['-priority', 'run_at', 'id'], condition=Q(state='queued'), name='task_queue_idx'),
+            models.Index(fields=['locked_at'], condition=Q(state='running'), name='task_running_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=Q(state='queued') & ~Q(key=''),
+                                    name='task_queued_key_uniq'),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,141 @@
+import base64
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.encode_cursor('n', self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.encode_cursor('p', self.object_list[0])
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод по ключу (date_field, id) от новых к старым.
+    Курсор хранит ключ крайней записи страницы, поэтому глубокие страницы
+    не требуют OFFSET и не дороже первой.
+    """
+
+    def __init__(self, queryset, per_page, date_field='created_date'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.date_field = date_field
+
+    def _key(self, obj):
+        if isinstance(obj, dict):
+            return obj[self.date_field], obj['id']
+        return getattr(obj, self.date_field), obj.id
+
+    def encode_cursor(self, direction, obj):
+        date, pk = self._key(obj)
+        raw = '%s|%s|%s' % (direction, date.isoformat(), pk)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            direction, date, pk = raw.split('|')
+            if direction not in ('n', 'p'):
+                raise ValueError(direction)
+            return direction, datetime.fromisoformat(date), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise Http404('Некорректный курсор страницы')
+
+    def page_queryset(self, cursor=None):
+        date_field = self.date_field
+        if not cursor:
+            return None, self.queryset.order_by('-' + date_field, '-id')[:self.per_page + 1]
+
+        direction, date, pk = self.decode_cursor(cursor)
+        # Лишнее условие по одной дате даёт планировщику диапазон по индексу
+        if direction == 'n':
+            queryset = self.queryset.filter(**{date_field + '__lte': date}).filter(
+                Q(**{date_field + '__lt': date}) | Q(id__lt=pk)
+            ).order_by('-' + date_field, '-id')
+        else:
+            queryset = self.queryset.filter(**{date_field + '__gte': date}).filter(
+                Q(**{date_field + '__gt': date}) | Q(id__gt=pk)
+            ).order_by(date_field, 'id')
+        return direction, queryset[:self.per_page + 1]
+
+    def build_page(self, direction, rows):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        # устаревший курсор (курсы удалили или сняли тег) может указывать за край: пустая страница без ссылок
+        if direction == 'p':
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=bool(rows), has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=direction == 'n' and bool(rows))
+
+    def page(self, cursor=None):
+        direction, queryset = self.page_queryset(cursor)
+        return self.build_page(direction, list(queryset))
+
+    async def apage(self, cursor=None):
+        direction, queryset = self.page_queryset(cursor)
+        return self.build_page(direction, [obj async for obj in queryset])
+
+
+class KeysetPaginationMixin:
+    paginate_by = 12
+    cursor_kwarg = 'cursor'
+    keyset_date_field = 'created_date'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, date_field=self.keyset_date_field)
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Для больших таблиц без фильтров вместо COUNT(*) берёт оценку числа строк из pg_class.reltuples.
+    С фильтрами и на маленьких таблицах считает точно.
+    """
+
+    estimate_threshold = 50000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        # фильтр менеджера по умолчанию (мягко удалённые курсы) на оценку почти не влияет
+        if queryset.query.where == queryset.model._default_manager.all().query.where:
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= self.estimate_threshold:
+                return row[0]
+        return super().count
@@ -0,0 +1,160 @@
+"""
+Счётчики просмотров курсов.
+
+Просмотр только увеличивает число в памяти процесса. По request_finished, не чаще раза
+в WEB_VIEW_FLUSH_SECONDS, накопленное пишется одним INSERT ... ON CONFLICT DO UPDATE
+в дневные счётчики CourseViewCount. Так горячий курс даёт одно обновление строки за интервал,
+а не по UPDATE на каждый просмотр. Пишет буфер только цикл запроса (или явный вызов flush): команды,
+воркер и тесты ничего не сбрасывают при выходе. При остановке или падении процесса теряются только
+просмотры последнего интервала.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Sum
+from django.http import Http404
+from django.utils import timezone
+
+from web.models import Course, CourseViewCount
+from web.pagination import KeysetPage
+
+logger = logging.getLogger(__name__)
+
+UPSERT_SQL = '''
+    INSERT INTO {counts} (course_id, day, views)
+    SELECT counted.course_id, counted.day, counted.views
+    FROM unnest(%s::bigint[], %s::date[], %s::integer[]) AS counted(course_id, day, views)
+    WHERE EXISTS (SELECT 1 FROM {courses} WHERE {courses}.id = counted.course_id AND {courses}.deleted_at IS NULL)
+    ON CONFLICT (course_id, day) DO UPDATE SET views = {counts}.views + EXCLUDED.views
+'''
+
+
+class ViewBuffer:
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def record(self, course_id):
+        with self.lock:
+            self.counts[(int(course_id), timezone.now().date())] += 1
+
+    def is_due(self):
+        return bool(self.counts) and (
+            len(self.counts) >= settings.WEB_VIEW_FLUSH_SIZE
+            or time.monotonic() - self.flushed_at >= settings.WEB_VIEW_FLUSH_SECONDS
+        )
+
+    def take(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.flushed_at = time.monotonic()
+        return counts
+
+    def clear(self):
+        self.take()
+
+    def flush(self):
+        counts = self.take()
+        if not counts:
+            return 0
+        # одинаковый порядок строк во всех процессах, чтобы параллельные сбросы не ловили взаимоблокировку
+        rows = sorted(counts.items())
+        sql = UPSERT_SQL.format(counts=CourseViewCount._meta.db_table, courses=Course._meta.db_table)
+        try:
+            with connections[router.db_for_write(CourseViewCount)].cursor() as cursor:
+                cursor.execute(sql, [
+                    [course_id for (course_id, _), _ in rows],
+                    [day for (_, day), _ in rows],
+                    [views for _, views in rows],
+                ])
+        except Exception:
+            logger.exception('Не удалось записать просмотры курсов, вернём их в буфер')
+            with self.lock:
+                self.counts.update(counts)
+            return 0
+        return len(rows)
+
+
+buffer = ViewBuffer()
+
+
+def record_view(course_id):
+    buffer.record(course_id)
+
+
+def popular_ranking(queryset=None, days=None):
+    since = timezone.now().date() - timedelta(days=(days or settings.WEB_POPULAR_DAYS) - 1)
+    counts = CourseViewCount.objects.filter(day__gte=since, course__deleted_at__isnull=True)
+    if queryset is not None and queryset.query.where:
+        counts = counts.filter(course__in=queryset.values('id'))
+    return (
+        counts
+        .values('course_id')
+        .annotate(total=Sum('views'))
+        .order_by('-total', '-course_id')
+        .values_list('course_id', 'total')
+    )
+
+
+class RankedPage(KeysetPage):
+    def __init__(self, object_list, paginator, position, has_next):
+        super().__init__(object_list, paginator, has_next=has_next, has_previous=position > 0)
+        self.position = position
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.position + self.paginator.per_page
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return max(self.position - self.paginator.per_page, 0)
+
+
+class PopularPaginator:
+    """
+    Курсы по числу просмотров за последние WEB_POPULAR_DAYS дней, порядок даёт агрегат
+    по дневным счётчикам. Рейтинг меняется между запросами, поэтому курсор — просто номер записи.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def ranking_slice(self, cursor):
+        if not cursor:
+            position = 0
+        elif cursor.isdigit():
+            position = int(cursor)
+        else:
+            raise Http404('Некорректный курсор страницы')
+        return position, popular_ranking(self.queryset)[position:position + self.per_page + 1]
+
+    def build_page(self, position, ranking, courses):
+        by_id = {course.id: course for course in courses}
+        rows = []
+        for course_id, total in ranking[:self.per_page]:
+            # курс мог быть удалён после подсчёта
+            if course_id in by_id:
+                by_id[course_id].recent_views = total
+                rows.append(by_id[course_id])
+        return RankedPage(rows, self, position, has_next=len(ranking) > self.per_page)
+
+    def page(self, cursor=None):
+        position, ranking = self.ranking_slice(cursor)
+        ranking = list(ranking)
+        courses = self.queryset.filter(id__in=[course_id for course_id, _ in ranking[:self.per_page]])
+        return self.build_page(position, ranking, list(courses))
+
+    async def apage(self, cursor=None):
+        position, ranking = self.ranking_slice(cursor)
+        ranking = [row async for row in ranking]
+        courses = self.queryset.filter(id__in=[course_id for course_id, _ in ranking[:self.per_page]])
+        return self.build_page(position, ranking, [course async for course in courses])
@@ -0,0 +1,99 @@
+"""
+Удаление курса в два этапа.
+
+soft_delete_course сразу помечает курс удалённым: менеджер Course.objects его больше не отдаёт,
+счётчики тегов и фасетов списываются, кеш сбрасывается. Комментарии, просмотры и прочие строки
+удаляет потом фоновая очистка пачками по PURGE_CHUNK_SIZE прямыми DELETE, без загрузки строк
+в Python и без долгих блокировок. Ход очистки виден в CoursePurge.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from web.cache import CATALOG_NAMESPACE, course_namespace, invalidate
+from web.cards import refresh_course_cards
+from web.facets import price_band
+from web.models import Comment, Course, CoursePurge, CourseViewCount, FacetCount, RelatedCourse
+from web.tasks import PRIORITY_LOW, task
+
+PURGE_CHUNK_SIZE = 1000
+
+CHUNK_SQL = 'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {where} LIMIT %s)'
+
+COURSE_SQL = 'DELETE FROM {table} WHERE id = %s AND deleted_at IS NOT NULL'
+
+
+def soft_delete_course(course):
+    with transaction.atomic():
+        now = timezone.now()
+        if not Course.objects.filter(pk=course.pk).update(deleted_at=now, modified_date=now):
+            return None
+        # связей с тегами и категориями у курса единицы: снимаем сразу, сигналы спишут счётчики,
+        # сбросят кеш тегов и пересчитают похожие курсы
+        course.tags.clear()
+        course.category.clear()
+        FacetCount.objects.adjust(FacetCount.PRICE, [price_band(course.price)], -1)
+        refresh_course_cards([course.pk])
+        invalidate([CATALOG_NAMESPACE, course_namespace(course.pk)])
+        purge = CoursePurge.objects.create(course_id=course.pk, title=course.title, total_rows=course.comment_count)
+        schedule_purge(purge.pk)
+    return purge
+
+
+def purge_steps(course_id):
+    content_type = ContentType.objects.get_for_model(Course)
+    return [
+        ('comments', Comment, 'course_id = %s', [course_id]),
+        ('views', CourseViewCount, 'course_id = %s', [course_id]),
+        ('related', RelatedCourse, 'course_id = %s OR related_id = %s', [course_id, course_id]),
+        ('categories', Course.category.through, 'course_id = %s', [course_id]),
+        ('tags', Course.tags.through, 'content_type_id = %s AND object_id = %s', [content_type.pk, course_id]),
+    ]
+
+
+def delete_in_chunks(purge, stage, model, where, params, chunk_size):
+    using = router.db_for_write(model)
+    table = connections[using].ops.quote_name(model._meta.db_table)
+    sql = CHUNK_SQL.format(table=table, where=where)
+    while True:
+        # каждая пачка в своей транзакции: блокировки короткие, прогресс виден сразу
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(sql, params + [chunk_size])
+                deleted = cursor.rowcount
+            CoursePurge.objects.filter(pk=purge.pk).update(stage=stage, deleted_rows=F('deleted_rows') + deleted)
+        if deleted < chunk_size:
+            return
+
+
+def purge_course(purge_id, chunk_size=PURGE_CHUNK_SIZE):
+    """Удаляет всё, что осталось от удалённого курса. Прерванную очистку можно запустить заново."""
+    purge = CoursePurge.objects.get(pk=purge_id)
+    if purge.state == CoursePurge.DONE:
+        return purge
+    CoursePurge.objects.filter(pk=purge.pk).update(state=CoursePurge.RUNNING, error='')
+    try:
+        for stage, model, where, params in purge_steps(purge.course_id):
+            delete_in_chunks(purge, stage, model, where, params, chunk_size)
+        using = router.db_for_write(Course)
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(COURSE_SQL.format(table=connections[using].ops.quote_name(Course._meta.db_table)),
+                               [purge.course_id])
+            CoursePurge.objects.filter(pk=purge.pk).update(state=CoursePurge.DONE, stage='',
+                                                           finished_at=timezone.now())
+    except Exception as e:
+        CoursePurge.objects.filter(pk=purge.pk).update(state=CoursePurge.FAILED, error=repr(e))
+        raise
+    purge.refresh_from_db()
+    return purge
+
+
+@task(priority=PRIORITY_LOW, max_attempts=5, key=lambda purge_id: 'purge:%s' % purge_id)
+def run_purge(purge_id):
+    purge_course(purge_id)
+
+
+def schedule_purge(purge_id):
+    run_purge.enqueue(purge_id)
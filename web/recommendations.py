@@ -0,0 +1,228 @@
+"""
+Похожие курсы по общим тегам и категориям.
+
+Курс — разреженный вектор признаков (теги и категории) с весами idf, сходство — косинус.
+Пересчёт идёт через обратный индекс «признак -> курсы», поэтому сравниваются только курсы
+с общими признаками, а не все пары.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+
+from web.cache import bump_versions, course_namespace
+from web.models import Course, FacetCount, RelatedCourse, TagCount
+from web.tasks import task
+
+RELATED_LIMIT = 6
+# категории шире тегов и говорят о сходстве меньше
+CATEGORY_WEIGHT = 0.5
+# признак чаще этого слишком общий, чтобы искать по нему кандидатов: перебор по нему квадратичный
+MAX_POSTINGS = 1000
+# число курсов с признаками для idf: пишет rebuild_all, инкрементальный пересчёт только читает
+TOTAL_CACHE_KEY = 'related:featured-courses'
+TOTAL_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def tag_feature(tag_id):
+    return 't%s' % tag_id
+
+
+def category_feature(category_id):
+    return 'c%s' % category_id
+
+
+def load_features(course_ids=None):
+    """course_id -> {признак: базовый вес}"""
+    tagged = Course.tags.through.objects.filter(content_type=ContentType.objects.get_for_model(Course))
+    categorized = Course.category.through.objects.all()
+    if course_ids is not None:
+        tagged = tagged.filter(object_id__in=course_ids)
+        categorized = categorized.filter(course_id__in=course_ids)
+    features = defaultdict(dict)
+    for course_id, tag_id in tagged.values_list('object_id', 'tag_id').iterator(chunk_size=10000):
+        features[course_id][tag_feature(tag_id)] = 1.0
+    for course_id, category_id in categorized.values_list('course_id', 'category_id').iterator(chunk_size=10000):
+        features[course_id][category_feature(category_id)] = CATEGORY_WEIGHT
+    return features
+
+
+def featured_course_count():
+    """Сколько курсов имеют хоть один признак — тот же total, что у rebuild_all."""
+    total = cache.get(TOTAL_CACHE_KEY)
+    if total is None:
+        tagged = Course.tags.through.objects.filter(
+            content_type=ContentType.objects.get_for_model(Course)).values('object_id')
+        total = tagged.union(Course.category.through.objects.values('course_id')).count()
+        cache.set(TOTAL_CACHE_KEY, total, TOTAL_CACHE_TIMEOUT)
+    return total
+
+
+def idf(document_frequency, total):
+    return math.log((1 + total) / (1 + document_frequency)) + 1
+
+
+def feature_weights(features, document_frequency, total):
+    # вес признака одинаков у всех курсов: базовый вес типа признака, умноженный на idf
+    weights = {}
+    for course_features in features.values():
+        for feature, base in course_features.items():
+            if feature not in weights:
+                weights[feature] = base * idf(document_frequency[feature], total)
+    return weights
+
+
+def course_norms(features, weights):
+    return {course_id: math.sqrt(sum(weights[feature] ** 2 for feature in course_features))
+            for course_id, course_features in features.items()}
+
+
+def candidate_features(course_features, document_frequency):
+    # кандидатов ищем только по достаточно редким признакам; если других нет — по всем
+    rare = [feature for feature in course_features if document_frequency[feature] <= MAX_POSTINGS]
+    return rare or list(course_features)
+
+
+def similarities(course_id, features, weights, norms, postings, document_frequency):
+    own = features[course_id]
+    searched = candidate_features(own, document_frequency)
+    scores = defaultdict(float)
+    for feature in searched:
+        contribution = weights[feature] ** 2
+        for other_id in postings[feature]:
+            scores[other_id] += contribution
+    scores.pop(course_id, None)
+    # частые признаки не порождают кандидатов, но в оценку найденных входят
+    frequent = [feature for feature in own if feature not in searched]
+    for other_id in scores:
+        other_features = features[other_id]
+        for feature in frequent:
+            if feature in other_features:
+                scores[other_id] += weights[feature] ** 2
+    norm = norms[course_id]
+    return {other_id: score / (norm * norms[other_id]) for other_id, score in scores.items()}
+
+
+def top(scores, limit=RELATED_LIMIT):
+    return heapq.nlargest(limit, ((score, other_id) for other_id, score in scores.items()))
+
+
+def build_postings(features):
+    postings = defaultdict(list)
+    for course_id, course_features in features.items():
+        for feature in course_features:
+            postings[feature].append(course_id)
+    return postings
+
+
+def rebuild_all(batch_size=5000):
+    """Полный пересчёт; возвращает число записанных связей."""
+    features = load_features()
+    postings = build_postings(features)
+    document_frequency = {feature: len(course_ids) for feature, course_ids in postings.items()}
+    weights = feature_weights(features, document_frequency, len(features))
+    norms = course_norms(features, weights)
+    cache.set(TOTAL_CACHE_KEY, len(features), TOTAL_CACHE_TIMEOUT)
+
+    def links():
+        for course_id in features:
+            scores = similarities(course_id, features, weights, norms, postings, document_frequency)
+            for score, related_id in top(scores):
+                yield RelatedCourse(course_id=course_id, related_id=related_id, score=score)
+
+    with transaction.atomic():
+        RelatedCourse.objects.all().delete()
+        written, batch = 0, []
+        for link in links():
+            batch.append(link)
+            if len(batch) >= batch_size:
+                RelatedCourse.objects.bulk_create(batch)
+                written, batch = written + len(batch), []
+        RelatedCourse.objects.bulk_create(batch)
+    return written + len(batch)
+
+
+def feature_frequencies(feature_sets):
+    tag_ids, category_ids = set(), set()
+    for course_features in feature_sets:
+        for feature in course_features:
+            (tag_ids if feature.startswith('t') else category_ids).add(feature[1:])
+    frequencies = {tag_feature(tag_id): count for tag_id, count in
+                   TagCount.objects.filter(tag_id__in=tag_ids).values_list('tag_id', 'count')}
+    frequencies.update({category_feature(value): count for value, count in FacetCount.objects.filter(
+        facet=FacetCount.CATEGORY, value__in=category_ids).values_list('value', 'count')})
+    # признак мог появиться раньше, чем обновился счётчик
+    for course_features in feature_sets:
+        for feature in course_features:
+            frequencies.setdefault(feature, 1)
+    return frequencies
+
+
+def update_course(course_id):
+    """
+    Пересчитывает похожие курсы для одного курса и вписывает/вычёркивает его в списках соседей.
+    Сходство симметрично, поэтому соседям достаточно сравнить новую оценку со своим текущим топом.
+    Курс, который из-за этого вытеснил кого-то или освободил место, дополнится при полном пересчёте.
+    """
+    own = load_features([course_id]).get(course_id, {})
+    total = featured_course_count()
+    # частоты признаков уже посчитаны в TagCount и FacetCount
+    searched = candidate_features(own, feature_frequencies([own]))
+
+    candidates = set()
+    if own:
+        candidates.update(Course.tags.through.objects.filter(
+            content_type=ContentType.objects.get_for_model(Course),
+            tag_id__in=[feature[1:] for feature in searched if feature.startswith('t')],
+        ).values_list('object_id', flat=True))
+        candidates.update(Course.category.through.objects.filter(
+            category_id__in=[feature[1:] for feature in searched if feature.startswith('c')],
+        ).values_list('course_id', flat=True))
+    candidates.discard(course_id)
+
+    features = load_features(candidates)
+    features[course_id] = own
+    document_frequency = feature_frequencies(features.values())
+    weights = feature_weights(features, document_frequency, total)
+    norms = course_norms(features, weights)
+    postings = {feature: [other_id for other_id in candidates if feature in features[other_id]]
+                for feature in searched}
+    scores = similarities(course_id, features, weights, norms, postings, document_frequency) if own else {}
+
+    holders = set(RelatedCourse.objects.filter(related_id=course_id).values_list('course_id', flat=True))
+    neighbours = (candidates | holders) - {course_id}
+    current = defaultdict(list)
+    for owner_id, related_id, score in RelatedCourse.objects.filter(course_id__in=neighbours).values_list(
+            'course_id', 'related_id', 'score'):
+        current[owner_id].append((score, related_id))
+
+    changed, links = [course_id], [RelatedCourse(course_id=course_id, related_id=related_id, score=score)
+                                   for score, related_id in top(scores)]
+    for owner_id in neighbours:
+        before = [(score, related_id) for score, related_id in current[owner_id] if related_id != course_id]
+        if scores.get(owner_id):
+            before.append((scores[owner_id], course_id))
+        after = heapq.nlargest(RELATED_LIMIT, before)
+        if sorted(after) != sorted(current[owner_id]):
+            changed.append(owner_id)
+            links += [RelatedCourse(course_id=owner_id, related_id=related_id, score=score)
+                      for score, related_id in after]
+
+    with transaction.atomic():
+        RelatedCourse.objects.filter(course_id__in=changed).delete()
+        RelatedCourse.objects.bulk_create(links)
+    bump_versions([course_namespace(changed_id) for changed_id in changed])
+    return len(changed)
+
+
+# несколько сигналов одного сохранения (теги, категории) дают одну задачу в очереди
+@task(key=lambda course_id: 'related:%s' % course_id)
+def run_update(course_id):
+    update_course(course_id)
+
+
+def schedule_update(course_id):
+    run_update.enqueue(course_id)
@@ -0,0 +1,43 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA = 'replica'
+
+# состояние текущего запроса; ReplicaRoutingMiddleware кладёт сюда изменяемый объект,
+# чтобы решение из process_view было видно и из потоков sync_to_async
+current_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self):
+        self.use_replica = False
+
+
+def replica_enabled():
+    return REPLICA in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    """
+    Чтение в запросах, помеченных ReplicaRoutingMiddleware, уходит на реплику,
+    всё остальное — на основную базу. Миграции применяются только к основной,
+    реплика получает их через репликацию.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        # сессию могли записать только что, на реплику она могла ещё не доехать
+        if state is not None and state.use_replica and model._meta.app_label != 'sessions':
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплика — копия основной базы, связи между объектами из них допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
@@ -0,0 +1,195 @@
+import contextlib
+import os
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from taggit.models import Tag
+
+from web.backends import invalidate_user
+from web.cache import CATALOG_NAMESPACE, CATEGORIES_NAMESPACE, course_namespace, invalidate, tag_namespace
+from web.cards import course_ids_for_category, course_ids_for_tag, refresh_course_cards, rename_author
+from web.facets import price_band
+from web.models import Category, Comment, Course, FacetCount, TagCount, Upload, User
+from web.popularity import buffer as view_buffer
+from web.recommendations import schedule_update
+
+
+def invalidate_courses(course_ids, tag_ids=()):
+    # курс виден на своей странице, в каталоге и на страницах своих тегов
+    course_tags = Q(taggit_taggeditem_items__content_type=ContentType.objects.get_for_model(Course),
+                    taggit_taggeditem_items__object_id__in=course_ids)
+    tag_slugs = Tag.objects.filter(course_tags | Q(id__in=tag_ids)).values_list('slug', flat=True).distinct()
+    invalidate([CATALOG_NAMESPACE] + [course_namespace(course_id) for course_id in course_ids]
+               + [tag_namespace(slug) for slug in tag_slugs])
+
+
+def invalidate_course(course_id, tag_ids=()):
+    invalidate_courses([course_id], tag_ids)
+
+
+@receiver(m2m_changed, sender=Course.tags.through)
+def course_tags_changed(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Course):
+        return
+    if action == 'pre_clear':
+        # после clear() уже не узнать, какие теги были у курса
+        instance._cleared_tag_ids = set(instance.tags.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_tag_ids', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    TagCount.objects.adjust(pk_set, 1 if action == 'post_add' else -1)
+    refresh_course_cards([instance.pk])
+    invalidate_course(instance.pk, pk_set)
+    schedule_update(instance.pk)
+
+
+@receiver(m2m_changed, sender=Course.category.through)
+def course_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        # remove() сообщает переданные id, а не реально удалённые связи; после clear() связей уже нет
+        links = sender.objects.filter(**{'category_id' if reverse else 'course_id': instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{'course_id__in' if reverse else 'category_id__in': pk_set})
+        instance._removed_links = set(links.values_list('course_id' if reverse else 'category_id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_add':
+        pk_set = instance.__dict__.pop('_removed_links', set())
+    delta = 1 if action == 'post_add' else -1
+    if not reverse:
+        FacetCount.objects.adjust(FacetCount.CATEGORY, pk_set, delta)
+        refresh_course_cards([instance.pk])
+        invalidate_course(instance.pk)
+        schedule_update(instance.pk)
+    else:
+        FacetCount.objects.adjust(FacetCount.CATEGORY, [instance.pk], delta * len(pk_set))
+        refresh_course_cards(pk_set)
+        invalidate([CATALOG_NAMESPACE, CATEGORIES_NAMESPACE])
+        for course_id in pk_set:
+            schedule_update(course_id)
+
+
+@receiver(pre_delete, sender=Course)
+def clear_course_relations(sender, instance, **kwargs):
+    if instance.deleted_at:
+        # мягко удалённый курс уже снял связи и списал счётчики в web.purge.soft_delete_course
+        return
+    # taggit не удаляет связи при удалении объекта, а каскад по m2m идёт без сигналов —
+    # чистим связи сами, чтобы счётчики тегов и категорий списались
+    instance.tags.clear()
+    instance.category.clear()
+    FacetCount.objects.adjust(FacetCount.PRICE, [price_band(instance.price)], -1)
+
+
+@receiver(pre_save, sender=Course)
+def remember_price_band(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._old_price_band = None
+        return
+    old_price = Course.objects.filter(pk=instance.pk).values_list('price', flat=True).first()
+    instance._old_price_band = price_band(old_price)
+
+
+@receiver(post_save, sender=Course)
+def update_price_facet(sender, instance, **kwargs):
+    old_band, new_band = instance.__dict__.pop('_old_price_band', None), price_band(instance.price)
+    if old_band == new_band:
+        return
+    if old_band is not None:
+        FacetCount.objects.adjust(FacetCount.PRICE, [old_band], -1)
+    FacetCount.objects.adjust(FacetCount.PRICE, [new_band], 1)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    refresh_course_cards([instance.pk])
+    invalidate_course(instance.pk)
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Tag)
+def remember_card_courses(sender, instance, **kwargs):
+    # связи с курсами удаляются каскадом без m2m-сигналов, карточки этих курсов обновим после удаления
+    ids = course_ids_for_category(instance.pk) if sender is Category else course_ids_for_tag(instance.pk)
+    instance._card_course_ids = list(ids)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def refresh_renamed_cards(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    course_ids = instance.__dict__.pop('_card_course_ids', None)
+    if course_ids is None:
+        course_ids = course_ids_for_category(instance.pk) if sender is Category else course_ids_for_tag(instance.pk)
+    refresh_course_cards(course_ids)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    invalidate([CATALOG_NAMESPACE, CATEGORIES_NAMESPACE])
+
+
+@receiver(post_delete, sender=Category)
+def delete_category_facet(sender, instance, **kwargs):
+    FacetCount.objects.filter(facet=FacetCount.CATEGORY, value=str(instance.pk)).delete()
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    if created:
+        Course.objects.filter(pk=instance.course_id).update(comment_count=F('comment_count') + 1)
+        refresh_course_cards([instance.course_id])
+        # число комментариев есть и на карточке в каталоге и на страницах тегов
+        invalidate_course(instance.course_id)
+    else:
+        invalidate([course_namespace(instance.course_id)])
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, **kwargs):
+    Course.objects.filter(pk=instance.course_id).update(comment_count=Greatest(F('comment_count') - 1, Value(0)))
+    refresh_course_cards([instance.course_id])
+    invalidate_course(instance.course_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def rename_card_author(sender, instance, **kwargs):
+    if rename_author(instance):
+        invalidate_courses(list(Course.objects.filter(user=instance).values_list('id', flat=True)))
+
+
+@receiver(post_delete, sender=Upload)
+def remove_upload_file(sender, instance, **kwargs):
+    # к моменту коммита delete() уже обнулит id, путь запоминаем сейчас
+    path = instance.path
+
+    def remove():
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+    transaction.on_commit(remove)
+
+
+@receiver(request_finished)
+def flush_course_views(sender, **kwargs):
+    if view_buffer.is_due():
+        view_buffer.flush()
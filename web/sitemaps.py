@@ -0,0 +1,206 @@
+"""
+Сайтмапы курсов, тегов и категорий готовыми файлами в WEB_SITEMAP_ROOT.
+
+Раздел режется на шарды по SHARD_SIZE id: в шард k попадают записи с id от k * SHARD_SIZE,
+поэтому удаление и добавление курсов не сдвигает соседние шарды. Для каждого шарда одним
+GROUP BY считается подпись (у курсов — сколько записей и когда менялась последняя, у тегов
+и категорий — md5 от списка их адресов), и при сборке перезаписываются только шарды, чья подпись
+разошлась с записанной в manifest.json. Отдаются только готовые файлы: пока build_sitemaps
+не запускали, индекс отвечает 404.
+Строки шарда читаются потоком через values_list(...).iterator(), без создания моделей.
+"""
+import json
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import MD5
+from django.http import Http404
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+from django.views.static import serve
+
+from web.models import Course, FacetCount, TagCount
+
+# протокол допускает до 50 000 ссылок в одном файле
+SHARD_SIZE = 10000
+ITERATOR_CHUNK_SIZE = 2000
+
+INDEX_NAME = 'sitemap.xml'
+MANIFEST_NAME = 'manifest.json'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def w3c_date(value):
+    return value.replace(microsecond=0).isoformat() if value else None
+
+
+def shard_name(section, shard):
+    return 'sitemap-%s-%s.xml' % (section, shard)
+
+
+class CourseSection:
+    name = 'courses'
+
+    def signatures(self):
+        # удалённые курсы тоже в подписи: мягкое удаление обновляет modified_date, и шард пересобирается
+        shards = (
+            Course.all_objects
+            .annotate(shard=F('id') / SHARD_SIZE)
+            .values('shard')
+            .annotate(alive=Count('id', filter=Q(deleted_at__isnull=True)), modified=Max('modified_date'))
+            .values_list('shard', 'alive', 'modified')
+        )
+        return {str(shard): [alive, w3c_date(modified)] for shard, alive, modified in shards if alive}
+
+    def lastmod(self, signature):
+        return signature[1]
+
+    def urls(self, shard):
+        courses = (
+            Course.objects
+            .filter(id__gte=shard * SHARD_SIZE, id__lt=(shard + 1) * SHARD_SIZE)
+            .order_by('id')
+            .values_list('id', 'slug', 'modified_date')
+        )
+        for course_id, slug, modified in courses.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            yield reverse('single_course', args=(slug, course_id)), w3c_date(modified)
+
+
+class TagSection:
+    name = 'tags'
+
+    def signatures(self):
+        # состав шарда и слаги: тег, ушедший в ноль, и смена слага меняют подпись
+        shards = (
+            TagCount.objects
+            .filter(count__gt=0)
+            .annotate(shard=F('tag_id') / SHARD_SIZE)
+            .values('shard')
+            .annotate(tags=Count('tag_id'), slugs=MD5(StringAgg('tag__slug', ' ', ordering='tag_id')))
+            .values_list('shard', 'tags', 'slugs')
+        )
+        return {str(shard): [tags, slugs] for shard, tags, slugs in shards}
+
+    def lastmod(self, signature):
+        return None
+
+    def urls(self, shard):
+        slugs = (
+            TagCount.objects
+            .filter(count__gt=0, tag_id__gte=shard * SHARD_SIZE, tag_id__lt=(shard + 1) * SHARD_SIZE)
+            .order_by('tag_id')
+            .values_list('tag__slug', flat=True)
+        )
+        for slug in slugs.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            yield reverse('courses_by_tag', args=(slug,)), None
+
+
+class CategorySection:
+    # категорий немного, они всегда в одном шарде
+    name = 'categories'
+
+    def signatures(self):
+        counts = FacetCount.objects.filter(facet=FacetCount.CATEGORY, count__gt=0).aggregate(
+            categories=Count('id'), values=MD5(StringAgg('value', ' ', ordering='value')))
+        return {'0': [counts['categories'], counts['values']]} if counts['categories'] else {}
+
+    def lastmod(self, signature):
+        return None
+
+    def urls(self, shard):
+        catalog = reverse('course_catalog')
+        values = (
+            FacetCount.objects
+            .filter(facet=FacetCount.CATEGORY, count__gt=0)
+            .order_by('value')
+            .values_list('value', flat=True)
+        )
+        for value in values.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            yield '%s?category=%s' % (catalog, value), None
+
+
+SECTIONS = [CourseSection(), TagSection(), CategorySection()]
+
+
+def write_atomic(path, chunks):
+    # читатель всегда видит либо старый файл целиком, либо новый; у параллельных сборок свои временные файлы
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(path), suffix='.tmp',
+                                     delete=False) as f:
+        try:
+            f.writelines(chunks)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+
+
+def urlset(urls):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="%s">\n' % XMLNS
+    for path, lastmod in urls:
+        yield '<url><loc>%s</loc>%s</url>\n' % (
+            escape(settings.WEB_SITE_URL + path), '<lastmod>%s</lastmod>' % lastmod if lastmod else '')
+    yield '</urlset>\n'
+
+
+def sitemap_index(manifest):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="%s">\n' % XMLNS
+    for section in SECTIONS:
+        for shard, signature in sorted(manifest.get(section.name, {}).items(), key=lambda item: int(item[0])):
+            path = reverse('sitemap_shard', args=(section.name, shard))
+            lastmod = section.lastmod(signature)
+            yield '<sitemap><loc>%s</loc>%s</sitemap>\n' % (
+                escape(settings.WEB_SITE_URL + path), '<lastmod>%s</lastmod>' % lastmod if lastmod else '')
+    yield '</sitemapindex>\n'
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build_sitemaps(root=None, force=False):
+    """Пересобирает изменившиеся шарды; возвращает (записано, удалено)."""
+    root = root or settings.WEB_SITEMAP_ROOT
+    os.makedirs(root, exist_ok=True)
+    previous = load_manifest(root)
+    manifest, written, removed = {}, 0, 0
+    for section in SECTIONS:
+        before = previous.get(section.name, {})
+        manifest[section.name] = current = section.signatures()
+        for shard, signature in current.items():
+            path = os.path.join(root, shard_name(section.name, shard))
+            if force or before.get(shard) != signature or not os.path.exists(path):
+                write_atomic(path, urlset(section.urls(int(shard))))
+                written += 1
+        for shard in set(before) - set(current):
+            try:
+                os.remove(os.path.join(root, shard_name(section.name, shard)))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    if written or removed or manifest != previous or not os.path.exists(os.path.join(root, INDEX_NAME)):
+        write_atomic(os.path.join(root, INDEX_NAME), sitemap_index(manifest))
+        write_atomic(os.path.join(root, MANIFEST_NAME), [json.dumps(manifest)])
+    return written, removed
+
+
+@require_GET
+def index(request):
+    # собирает только build_sitemaps по расписанию, запрос не должен строить все шарды; serve до сборки даст 404
+    return serve(request, INDEX_NAME, document_root=settings.WEB_SITEMAP_ROOT)
+
+
+@require_GET
+def shard(request, section, shard):
+    if section not in {section.name for section in SECTIONS}:
+        raise Http404('Нет такого раздела')
+    return serve(request, shard_name(section, shard), document_root=settings.WEB_SITEMAP_ROOT)
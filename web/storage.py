@@ -0,0 +1,48 @@
+import hashlib
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    Сохраняет файл под именем <каталог upload_to>/<ab>/<sha256><расширение>.
+    Одинаковые загрузки ложатся в один файл, повторное сохранение ничего не пишет.
+    Поэтому файл нельзя удалять вместе с одной записью — на него могут ссылаться другие.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = content_hash(content)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest + extension)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def save_exact(self, name, content):
+        # превью адресуются по имени оригинала, их имя хешировать нельзя
+        if self.exists(name):
+            self.delete(name)
+        return super().save(name, content)
+
+
+def save_exact(storage, name, content):
+    if isinstance(storage, ContentHashStorage):
+        return storage.save_exact(name, content)
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, content)
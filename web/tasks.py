@@ -0,0 +1,172 @@
+"""
+Очередь фоновых задач в PostgreSQL, без отдельного брокера.
+
+Функция с декоратором @task ставится в очередь через func.enqueue(...): в таблицу Task пишется
+строка в той же транзакции, что и данные, поэтому воркер увидит задачу только после коммита.
+Воркер (manage.py run_worker) забирает задачи SELECT ... FOR UPDATE SKIP LOCKED в порядке
+приоритета: параллельные воркеры не ждут друг друга и не берут одну задачу дважды. Упавшая задача
+повторяется с растущей задержкой до max_attempts раз, потом остаётся в таблице с ошибкой.
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from web.models import Task
+
+logger = logging.getLogger(__name__)
+
+# чем больше, тем раньше; превью нужны пользователю сразу, дочистка может подождать
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+MAX_RETRY_DELAY = 60 * 60
+# как часто воркер возвращает в очередь задачи, чей воркер умер, не доделав их
+STALE_CHECK_SECONDS = 60
+
+registry = {}
+
+
+def enqueue(name, args=(), kwargs=None, priority=PRIORITY_NORMAL, max_attempts=3, key='', delay=None):
+    task = Task(name=name, args=list(args), kwargs=kwargs or {}, priority=priority, max_attempts=max_attempts,
+                key=key, run_at=timezone.now() + timedelta(seconds=delay or 0))
+    # ключ уже ждёт в очереди — ON CONFLICT DO NOTHING, вторую такую же задачу не ставим
+    Task.objects.bulk_create([task], ignore_conflicts=bool(key))
+
+
+def task(priority=PRIORITY_NORMAL, max_attempts=3, key=None):
+    """
+    Регистрирует функцию как фоновую задачу. Аргументы должны сериализоваться в JSON.
+    key(*args, **kwargs) даёт ключ, по которому одинаковые задачи в очереди схлопываются.
+    """
+    def decorator(func):
+        name = '%s.%s' % (func.__module__, func.__name__)
+        registry[name] = func
+
+        def delay(*args, **kwargs):
+            if settings.WEB_TASKS_EAGER:
+                # без воркера (разработка, отладка): выполняем сразу после коммита в этом же процессе
+                transaction.on_commit(lambda: func(*args, **kwargs))
+                return
+            enqueue(name, args, kwargs, priority=priority, max_attempts=max_attempts,
+                    key=key(*args, **kwargs) if key else '')
+
+        func.task_name = name
+        func.enqueue = delay
+        return func
+    return decorator
+
+
+def get_handler(name):
+    if name not in registry:
+        # модуль задачи мог ещё не импортироваться в процессе воркера
+        import_string(name)
+    return registry[name]
+
+
+def retry_delay(attempts):
+    return min(settings.WEB_TASK_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, которые висят в running дольше WEB_TASK_TIMEOUT (воркер умер)."""
+    stale = Task.objects.filter(
+        state=Task.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=settings.WEB_TASK_TIMEOUT))
+    with transaction.atomic():
+        failed = stale.filter(attempts__gte=F('max_attempts')).update(
+            state=Task.FAILED, error='Воркер не завершил задачу')
+        # такая же задача уже снова стоит в очереди — она и сделает работу
+        stale.filter(Exists(Task.objects.filter(state=Task.QUEUED, key=OuterRef('key')).exclude(key=''))).delete()
+        # из зависших задач с одним ключом в очередь вернётся одна, иначе нарушится task_queued_key_uniq
+        stale.exclude(key='').filter(Exists(stale.filter(key=OuterRef('key'), id__lt=OuterRef('id')))).delete()
+        requeued = stale.update(state=Task.QUEUED, locked_at=None, worker='')
+    return requeued, failed
+
+
+class Worker:
+    def __init__(self, name=None):
+        self.name = name or '%s:%s' % (socket.gethostname(), os.getpid())
+        self.stopping = False
+
+    def stop(self, *args):
+        # текущая задача доделывается, новые не берутся
+        self.stopping = True
+
+    def claim(self):
+        with transaction.atomic():
+            task = (
+                Task.objects
+                .select_for_update(skip_locked=True)
+                .filter(state=Task.QUEUED, run_at__lte=timezone.now())
+                .order_by('-priority', 'run_at', 'id')
+                .first()
+            )
+            if task is None:
+                return None
+            task.state = Task.RUNNING
+            task.locked_at = timezone.now()
+            task.worker = self.name
+            task.attempts += 1
+            task.save(update_fields=['state', 'locked_at', 'worker', 'attempts'])
+        return task
+
+    def execute(self, task):
+        try:
+            get_handler(task.name)(*task.args, **task.kwargs)
+        except Exception:
+            logger.exception('Фоновая задача %s (%s) упала, попытка %d', task.name, task.pk, task.attempts)
+            self.fail(task, traceback.format_exc())
+        else:
+            Task.objects.filter(pk=task.pk).delete()
+        finally:
+            close_old_connections()
+
+    def fail(self, task, error):
+        tasks = Task.objects.filter(pk=task.pk)
+        if task.attempts >= task.max_attempts:
+            tasks.update(state=Task.FAILED, error=error)
+        else:
+            run_at = timezone.now() + timedelta(seconds=retry_delay(task.attempts))
+            try:
+                with transaction.atomic():
+                    tasks.update(state=Task.QUEUED, run_at=run_at, locked_at=None, worker='', error=error)
+            except IntegrityError:
+                # пока задача выполнялась, такую же поставили заново: повторять нечего
+                tasks.delete()
+
+    def run(self, burst=False):
+        """Крутится, пока не остановят; с burst=True выходит, когда очередь опустела."""
+        checked_at = None
+        while not self.stopping:
+            try:
+                if checked_at is None or time.monotonic() - checked_at >= STALE_CHECK_SECONDS:
+                    requeue_stale()
+                    checked_at = time.monotonic()
+                task = self.claim()
+            except DatabaseError:
+                # база перезапускается или недоступна: процесс воркера не должен из-за этого умирать
+                logger.exception('Воркер %s не смог обратиться к очереди', self.name)
+                close_old_connections()
+                time.sleep(settings.WEB_TASK_POLL_SECONDS)
+                continue
+            if task is None:
+                if burst:
+                    return
+                close_old_connections()
+                time.sleep(settings.WEB_TASK_POLL_SECONDS)
+                continue
+            try:
+                self.execute(task)
+            except DatabaseError:
+                # задача останется в running и вернётся в очередь через requeue_stale
+                logger.exception('Воркер %s не смог записать результат задачи %s', self.name, task.pk)
+                close_old_connections()
@@ -0,0 +1,30 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from web.images import DERIVATIVE_WIDTHS, derivative_name, has_derivatives
+
+register = template.Library()
+
+
+def _srcset(name, extension):
+    return ', '.join(
+        '%s %dw' % (default_storage.url(derivative_name(name, width, extension)), width)
+        for width in DERIVATIVE_WIDTHS
+    )
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', **attrs):
+    if not image:
+        return ''
+    attributes = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+    if not has_derivatives(image.name):
+        return format_html('<img src="{}" {}>', image.url, attributes)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" loading="lazy" {}></picture>',
+        _srcset(image.name, 'webp'), sizes,
+        default_storage.url(derivative_name(image.name, DERIVATIVE_WIDTHS[0], 'jpg')),
+        _srcset(image.name, 'jpg'), sizes, attributes,
+    )
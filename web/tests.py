@@ -1,3 +1,682 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase as DjangoTestCase
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from taggit.models import Tag
+
+from web.admin import CourseAdmin
+from web.backends import CACHED_BACKEND, CachedModelBackend, user_cache_key
+from web.cache import CATALOG_NAMESPACE, get_versions, tag_namespace
+from web.cards import rebuild_course_cards, refresh_course_cards
+from web.exports import course_rows
+from web.forms import CourseForm, UploadedPart
+from web.management.commands.bench_views import ROUTES
+from web.facets import price_band
+from web.models import (Category, Comment, Course, CourseCard, CoursePurge, CourseViewCount, FacetCount,
+                        RelatedCourse, TagCount, Task, Upload, User)
+from web.pagination import KeysetPaginator
+from web.purge import delete_in_chunks, soft_delete_course
+from web.recommendations import TOTAL_CACHE_KEY, featured_course_count, rebuild_all, update_course
+from web.sitemaps import build_sitemaps, shard_name
+from web.popularity import buffer as view_buffer, record_view
+from web.tasks import Worker, requeue_stale
+from web.throttle import COMMENT_IP_BUCKET
+
+
+class TestCase(DjangoTestCase):
+    def setUp(self):
+        super().setUp()
+        # просмотры из запросов одного теста не должны попасть в следующий
+        self.addCleanup(view_buffer.clear)
+
+
+def create_course(user, title, **kwargs):
+    return Course.objects.create(user=user, title=title, slug=title.lower().replace(' ', '-'), text='Описание',
+                                 **kwargs)
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+        cls.courses = [create_course(cls.user, 'Course %d' % i) for i in range(3)]
+
+    def test_pages_follow_cursors(self):
+        paginator = KeysetPaginator(Course.objects.all(), 2)
+        first = paginator.page()
+        self.assertEqual([course.pk for course in first], [self.courses[2].pk, self.courses[1].pk])
+        second = paginator.page(first.next_cursor)
+        self.assertEqual([course.pk for course in second], [self.courses[0].pk])
+        self.assertFalse(second.has_next())
+        self.assertEqual([course.pk for course in paginator.page(second.previous_cursor)],
+                         [course.pk for course in first])
+
+    def test_stale_cursor_gives_empty_page(self):
+        paginator = KeysetPaginator(Course.objects.all(), 2)
+        # курсоры за краем: старше самого старого курса и новее самого нового
+        past_end = Course(id=0, created_date=timezone.now() - timedelta(days=365))
+        before_start = Course(id=10 ** 9, created_date=timezone.now() + timedelta(days=365))
+        for cursor in (paginator.encode_cursor('n', past_end), paginator.encode_cursor('p', before_start)):
+            page = paginator.page(cursor)
+            self.assertEqual(list(page), [])
+            self.assertFalse(page.has_other_pages())
+            self.assertIsNone(page.next_cursor)
+            self.assertIsNone(page.previous_cursor)
+
+    def test_stale_cursor_page_renders(self):
+        cursor = KeysetPaginator(Course.objects.all(), 2).encode_cursor(
+            'n', Course(id=0, created_date=timezone.now() - timedelta(days=365)))
+        response = self.client.get(reverse('main_page'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+
+
+class ApiStaleCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+        cls.course = create_course(cls.user, 'Course')
+        Comment.objects.create(course=cls.course, user=cls.user, text='Комментарий')
+
+    def assert_empty_page(self, url, date_field='created_date'):
+        model = Course if date_field == 'created_date' else Comment
+        cursor = KeysetPaginator(model.objects.all(), 20, date_field=date_field).encode_cursor(
+            'n', model(id=0, **{date_field: timezone.now() - timedelta(days=365)}))
+        response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': [], 'next': None, 'previous': None})
+
+    def test_course_list(self):
+        self.assert_empty_page(reverse('api_courses'))
+
+    def test_course_comments(self):
+        self.assert_empty_page(reverse('api_course_comments', args=(self.course.pk,)), date_field='create_date')
+
+
+class CourseExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='secret')
+        for i in range(5):
+            create_course(cls.user, 'Course %d' % i).tags.add('tag-%d' % i)
+
+    def test_admin_queryset_exports_without_per_course_queries(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        queryset = CourseAdmin(Course, admin.site).get_queryset(request)
+        ContentType.objects.get_for_model(Course)
+        # курсы, их теги и категории — по запросу на пачку, а не на курс
+        with self.assertNumQueries(3):
+            rows = list(course_rows(queryset))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0][-1], 'Описание')
+
+
+class CourseAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='secret')
+        cls.course = create_course(cls.user, 'Python basics')
+        create_course(cls.user, 'Django')
+
+    def test_prefix_of_title_matches(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'web', 'model_name': 'comment', 'field_name': 'course', 'term': 'pyth',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], [str(self.course.pk)])
+
+
+SHARED_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+class CachedModelBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', password='secret')
+
+    def test_session_from_model_backend_survives(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_shared_cache_reads_database(self):
+        with self.assertNumQueries(1):
+            CachedModelBackend().get_user(self.user.pk)
+        with self.assertNumQueries(1):
+            CachedModelBackend().get_user(self.user.pk)
+
+    def test_wrong_password_is_hashed_once(self):
+        with mock.patch.object(User, 'check_password', autospec=True, return_value=False) as check_password:
+            response = self.client.post(reverse('login'), {'username': 'student', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+        self.assertEqual(check_password.call_count, 1)
+
+
+@override_settings(WEB_USER_CACHE='shared', CACHES=SHARED_CACHES)
+class SharedUserCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', password='secret')
+
+    def setUp(self):
+        super().setUp()
+        # locmem с одним LOCATION общий для всех тестов процесса
+        caches['shared'].clear()
+
+    def test_shared_cache_is_invalidated_on_save(self):
+        with self.assertNumQueries(1):
+            CachedModelBackend().get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            CachedModelBackend().get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('changed')
+            self.user.save()
+        self.assertTrue(CachedModelBackend().get_user(self.user.pk).check_password('changed'))
+
+    def test_login_session_uses_cached_user_without_password(self):
+        self.client.post(reverse('login'), {'username': 'student', 'password': 'secret'})
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], CACHED_BACKEND)
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+        cached = caches['shared'].get(user_cache_key(self.user.pk))
+        self.assertNotIn('password', cached['fields'])
+        self.assertNotIn(self.user.password, str(cached))
+        # хеш сессии из кеша совпадает с сессионным: пользователь не разлогинен
+        self.assertEqual(self.client.get(reverse('profile')).context['user'].pk, self.user.pk)
+        self.client.post(reverse('profile'), {'username': 'student', 'email': 'student@example.com',
+                                              'first_name': 'Имя', 'last_name': ''})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Имя')
+        self.assertTrue(self.user.check_password('secret'))
+
+
+class RequeueStaleTests(TestCase):
+    def stale_task(self, key):
+        return Task.objects.create(name='web.purge.purge_course', key=key, state=Task.RUNNING, attempts=1,
+                                   locked_at=timezone.now() - timedelta(days=1))
+
+    def test_one_task_per_key_is_requeued(self):
+        first, second = self.stale_task('purge:1'), self.stale_task('purge:1')
+        other = self.stale_task('')
+        self.assertEqual(requeue_stale(), (2, 0))
+        self.assertEqual(set(Task.objects.filter(state=Task.QUEUED).values_list('pk', flat=True)), {first.pk, other.pk})
+        self.assertFalse(Task.objects.filter(pk=second.pk).exists())
+
+    def test_queued_twin_wins(self):
+        queued = Task.objects.create(name='web.purge.purge_course', key='purge:1')
+        self.stale_task('purge:1')
+        self.assertEqual(requeue_stale(), (0, 0))
+        self.assertEqual(list(Task.objects.values_list('pk', flat=True)), [queued.pk])
+
+    def test_worker_survives_database_errors(self):
+        worker = Worker()
+        claim = mock.Mock(side_effect=[OperationalError('connection refused'), None])
+        with mock.patch.object(worker, 'claim', claim), mock.patch('web.tasks.time.sleep'), \
+                self.assertLogs('web.tasks', 'ERROR'):
+            worker.run(burst=True)
+        self.assertEqual(claim.call_count, 2)
+
+
+def image_bytes(image_format='PNG'):
+    buffer = BytesIO()
+    Image.effect_noise((400, 300), 64).convert('RGB').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        settings = self.settings(WEB_UPLOAD_TEMP_DIR=temp_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.user)
+
+    def send(self, filename, data):
+        state = self.client.post(reverse('upload_create'), {'filename': filename, 'size': len(data)}).json()
+        return self.client.generic('PATCH', state['url'], data, content_type='application/octet-stream',
+                                   HTTP_UPLOAD_OFFSET='0')
+
+    def test_complete_image_is_accepted(self):
+        response = self.send('cover.png', image_bytes())
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['completed'])
+        self.assertIsNone(Upload.objects.get().writing_since)
+
+    def test_extension_must_match_format(self):
+        response = self.send('cover.jpg', image_bytes('PNG'))
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_damaged_image_is_rejected(self):
+        # заголовок цел, обрезана половина сжатых данных
+        data = image_bytes('JPEG')
+        response = self.send('cover.jpg', data[:len(data) // 2])
+        self.assertEqual(response.status_code, 422)
+
+    def test_chunk_of_busy_upload_gets_conflict(self):
+        state = self.client.post(reverse('upload_create'), {'filename': 'cover.png', 'size': 10}).json()
+        Upload.objects.update(writing_since=timezone.now())
+        response = self.client.generic('PATCH', state['url'], b'0123456789', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('error', response.json())
+
+    def test_invalid_form_does_not_open_upload(self):
+        self.send('cover.png', image_bytes())
+        form = CourseForm(data={'title': '', 'upload': Upload.objects.get().pk}, uploader=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertNotIsInstance(form.cleaned_data.get('image'), UploadedPart)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTests(TestCase):
+    """Те же лимиты запросов, что у bench_views, но на каждом прогоне тестов."""
+    budgets = {(name, login): budget for name, login, budget in ROUTES}
+    # списки админки: число запросов не зависит от числа строк на странице
+    admin_budgets = {'course': 7, 'comment': 5, 'user': 5, 'category': 5, 'task': 6}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('author', password='secret')
+        category = Category.objects.create(name='Программирование')
+        for i in range(25):
+            course = create_course(cls.user, 'Python course %d' % i)
+            course.tags.add('python', 'tag-%d' % (i % 3))
+            course.category.add(category)
+            Comment.objects.create(course=course, user=cls.user, text='Комментарий %d' % i)
+            CourseViewCount.objects.create(course=course, day=timezone.now().date(), views=i + 1)
+        cls.course = course
+        cls.comment = Comment.objects.filter(course=course).first()
+
+    def assert_budget(self, name, url, login=False, budget=None):
+        if login:
+            self.client.force_login(self.user)
+        # первый запрос прогревает кеш ContentType, как и в bench_views
+        self.client.get(url)
+        if budget is None:
+            budget = self.budgets[name, login]
+        with self.subTest(name, login=login), self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_catalog(self):
+        self.assert_budget('main_page', reverse('main_page'))
+        self.assert_budget('main_page_popular', reverse('main_page') + '?sort=popular')
+        self.assert_budget('courses_by_tag', reverse('courses_by_tag', args=('python',)))
+        self.assert_budget('course_search', reverse('course_search') + '?q=Python')
+        self.assert_budget('course_catalog', reverse('course_catalog'))
+
+    def test_course_detail(self):
+        self.assert_budget('single_course', reverse('single_course', args=(self.course.slug, self.course.pk)))
+        self.assert_budget('single_course', reverse('single_course', args=(self.course.slug, self.course.pk)),
+                           login=True)
+
+    def test_api(self):
+        self.assert_budget('api_courses', reverse('api_courses'))
+        self.assert_budget('api_course', reverse('api_course', args=(self.course.pk,)))
+        self.assert_budget('api_course_comments', reverse('api_course_comments', args=(self.course.pk,)))
+        self.assert_budget('api_tags', reverse('api_tags'))
+
+    def test_logged_in_pages(self):
+        self.assert_budget('main_page', reverse('main_page'), login=True)
+        self.assert_budget('profile', reverse('profile'), login=True)
+        self.assert_budget('course_update', reverse('course_update', args=(self.course.slug, self.course.pk)),
+                           login=True)
+        self.assert_budget('update_comment', reverse('update_comment', args=(
+            self.course.slug, self.course.pk, self.comment.pk)), login=True)
+
+    def test_admin_changelists(self):
+        for model, budget in self.admin_budgets.items():
+            self.assert_budget(model, reverse('admin:web_%s_changelist' % model), login=True, budget=budget)
+
+
+class ViewBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+        cls.course = create_course(cls.user, 'Course')
+
+    def test_views_of_deleted_course_are_dropped(self):
+        record_view(self.course.pk)
+        Course.objects.filter(pk=self.course.pk).update(deleted_at=timezone.now())
+        view_buffer.flush()
+        self.assertFalse(CourseViewCount.objects.exists())
+
+    def test_flush_writes_daily_counts(self):
+        record_view(self.course.pk)
+        record_view(self.course.pk)
+        self.assertEqual(view_buffer.flush(), 1)
+        self.assertEqual(CourseViewCount.objects.get(course=self.course).views, 2)
+
+
+class TagCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+
+    def setUp(self):
+        super().setUp()
+        self.course = create_course(self.user, 'Python')
+        self.course.tags.add('python', 'django')
+        create_course(self.user, 'Flask').tags.add('python')
+
+    def counts(self):
+        return dict(TagCount.objects.filter(count__gt=0).values_list('tag__name', 'count'))
+
+    def test_form_edit_changes_tags(self):
+        form = CourseForm(data={'title': 'Python', 'text': 'Описание', 'tags': 'python, asyncio'},
+                          instance=self.course, uploader=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(self.counts(), {'python': 2, 'asyncio': 1})
+
+    def test_clear(self):
+        self.course.tags.clear()
+        self.assertEqual(self.counts(), {'python': 1})
+
+    def test_course_delete(self):
+        self.course.delete()
+        self.assertEqual(self.counts(), {'python': 1})
+
+    def test_adding_existing_tag_is_not_counted_twice(self):
+        self.course.tags.add('python')
+        self.assertEqual(self.counts(), {'python': 2, 'django': 1})
+
+
+class CourseCardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+        category = Category.objects.create(name='Программирование')
+        cls.course = create_course(cls.user, 'Python', price=100)
+        cls.course.tags.add('python', 'django')
+        cls.course.category.add(category)
+        create_course(cls.user, 'Flask').tags.add('python')
+
+    def cards(self):
+        return list(CourseCard.objects.order_by('id').values())
+
+    def test_refresh_matches_rebuild(self):
+        Comment.objects.create(course=self.course, user=self.user, text='Комментарий')
+        Tag.objects.filter(name='django').update(name='Django')
+        refresh_course_cards([self.course.pk])
+        refreshed = self.cards()
+        CourseCard.objects.all().delete()
+        self.assertEqual(rebuild_course_cards(), 2)
+        self.assertEqual(self.cards(), refreshed)
+        card = CourseCard.objects.get(pk=self.course.pk)
+        self.assertEqual((card.comment_count, card.tag_names), (1, ['Django', 'python']))
+
+    def test_deleted_course_loses_card(self):
+        Course.objects.filter(pk=self.course.pk).update(deleted_at=timezone.now())
+        refresh_course_cards([self.course.pk])
+        self.assertFalse(CourseCard.objects.filter(pk=self.course.pk).exists())
+
+    def assert_catalog_invalidated(self, change):
+        namespaces = [CATALOG_NAMESPACE, tag_namespace('python')]
+        before = get_versions(namespaces)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertTrue(all(old != new for old, new in zip(before, get_versions(namespaces))))
+
+    def test_comments_invalidate_catalog_pages(self):
+        comment = Comment(course=self.course, user=self.user, text='Комментарий')
+        self.assert_catalog_invalidated(comment.save)
+        self.assert_catalog_invalidated(comment.delete)
+
+    def test_author_rename_invalidates_catalog_pages(self):
+        self.user.username = 'teacher'
+        self.assert_catalog_invalidated(self.user.save)
+        self.assertEqual(CourseCard.objects.get(pk=self.course.pk).author_name, 'teacher')
+
+
+class SitemapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+        cls.course = create_course(cls.user, 'Python')
+        cls.course.tags.add('python')
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = self.settings(WEB_SITEMAP_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def tag_shard(self):
+        with open(os.path.join(self.root, shard_name('tags', 0)), encoding='utf-8') as f:
+            return f.read()
+
+    def test_index_is_not_built_by_request(self):
+        self.assertEqual(self.client.get(reverse('sitemap_index')).status_code, 404)
+        self.assertEqual(os.listdir(self.root), [])
+        build_sitemaps()
+        self.assertEqual(self.client.get(reverse('sitemap_index')).status_code, 200)
+
+    def test_tag_shard_follows_members_with_same_counts(self):
+        build_sitemaps()
+        # один тег ушёл в ноль, другой появился: число тегов и курсов прежнее
+        self.course.tags.set(['django'])
+        build_sitemaps()
+        self.assertIn(reverse('courses_by_tag', args=('django',)) + '<', self.tag_shard())
+        self.assertNotIn(reverse('courses_by_tag', args=('python',)) + '<', self.tag_shard())
+
+    def test_renamed_slug_rewrites_shard(self):
+        build_sitemaps()
+        Tag.objects.filter(slug='python').update(slug='python3')
+        build_sitemaps()
+        self.assertIn('python3', self.tag_shard())
+        self.assertEqual([name for name in os.listdir(self.root) if name.endswith('.tmp')], [])
+
+
+class ImportCoursesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+
+    def import_lines(self, *lines, dry_run=False):
+        # рядом с файлом команда пишет файл прогресса
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'courses.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        stdout, stderr = StringIO(), StringIO()
+        args = [path, '--dry-run'] if dry_run else [path]
+        call_command('import_courses', *args, stdout=stdout, stderr=stderr)
+        return stderr.getvalue()
+
+    def test_bad_lines_are_row_errors(self):
+        good = '{"username": "author", "title": "Python", "text": "Описание", "categories": ["Программирование"]}'
+        long_category = '{"username": "author", "title": "Django", "text": "Описание", "categories": ["%s"]}' % (
+            'к' * 65)
+        for dry_run in (True, False):
+            errors = self.import_lines(good, '{"username": "author", "title": ', '[1, 2]', long_category,
+                                       dry_run=dry_run)
+            self.assertIn('запись 2: некорректный JSON', errors)
+            self.assertIn('запись 3: ожидался объект JSON', errors)
+            self.assertIn('запись 4: ', errors)
+        self.assertEqual(list(Course.objects.values_list('title', flat=True)), ['Python'])
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Программирование'])
+
+
+class CommentThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+        cls.course = create_course(cls.user, 'Python')
+
+    def setUp(self):
+        super().setUp()
+        # вёдра лежат в кеше и переживают тест
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.url = reverse('single_course', args=(self.course.slug, self.course.pk))
+
+    def test_anonymous_posts_do_not_drain_address_bucket(self):
+        for _ in range(COMMENT_IP_BUCKET.capacity + 1):
+            self.assertEqual(self.client.post(self.url, {'text': 'Спам'}).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(self.url, {'text': 'Комментарий'}).status_code, 302)
+        self.assertEqual(self.course.course_comments.count(), 1)
+
+    @override_settings(WEB_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_address_comes_from_proxy_header(self):
+        for _ in range(COMMENT_IP_BUCKET.capacity):
+            COMMENT_IP_BUCKET.consume('10.0.0.1')
+        self.client.force_login(self.user)
+        response = self.client.post(self.url, {'text': 'Комментарий'}, HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post(self.url, {'text': 'Комментарий'}, HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+
+    def test_comment_on_deleted_course_is_rejected(self):
+        self.client.force_login(self.user)
+        Course.objects.filter(pk=self.course.pk).update(deleted_at=timezone.now())
+        self.assertEqual(self.client.post(self.url, {'text': 'Комментарий'}).status_code, 404)
+        self.assertFalse(Comment.objects.exists())
+
+
+# воркер закрывает соединение после задачи, внутри транзакции TestCase так нельзя
+@override_settings(WEB_TASKS_EAGER=False)
+class CoursePurgeTests(TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(view_buffer.clear)
+        self.user = User.objects.create_user('author', password='secret')
+        self.category = Category.objects.create(name='Программирование')
+        self.other = create_course(self.user, 'Flask')
+        self.other.tags.add('python')
+        self.course = create_course(self.user, 'Python', price=100)
+        self.course.tags.add('python', 'django')
+        self.course.category.add(self.category)
+        for i in range(5):
+            Comment.objects.create(course=self.course, user=self.user, text='Комментарий %d' % i)
+        CourseViewCount.objects.create(course=self.course, day=timezone.now().date(), views=3)
+        RelatedCourse.objects.create(course=self.course, related=self.other, score=1)
+        RelatedCourse.objects.create(course=self.other, related=self.course, score=1)
+        Task.objects.all().delete()
+
+    def assert_purged(self):
+        self.assertEqual(CoursePurge.objects.get(course_id=self.course.pk).state, CoursePurge.DONE)
+        self.assertFalse(Course.all_objects.filter(pk=self.course.pk).exists())
+        self.assertFalse(Comment.objects.filter(course_id=self.course.pk).exists())
+        self.assertFalse(CourseViewCount.objects.filter(course_id=self.course.pk).exists())
+        self.assertFalse(RelatedCourse.objects.exists())
+        self.assertFalse(CourseCard.objects.filter(pk=self.course.pk).exists())
+        self.assertEqual(dict(TagCount.objects.values_list('tag__name', 'count')), {'python': 1, 'django': 0})
+        facets = dict(FacetCount.objects.values_list('value', 'count'))
+        self.assertEqual(facets[str(self.category.pk)], 0)
+        self.assertEqual(facets[str(price_band(100))], 0)
+        self.assertFalse(Task.objects.exists())
+
+    def test_worker_purges_soft_deleted_course(self):
+        soft_delete_course(self.course)
+        self.assertFalse(Course.objects.filter(pk=self.course.pk).exists())
+        Worker().run(burst=True)
+        self.assert_purged()
+
+    def test_interrupted_purge_can_be_rerun(self):
+        soft_delete_course(self.course)
+
+        def interrupt(purge, stage, *args):
+            if stage == 'related':
+                raise OperationalError('connection lost')
+            return delete_in_chunks(purge, stage, *args)
+
+        with mock.patch('web.purge.delete_in_chunks', interrupt), self.assertLogs('web.tasks', 'ERROR'):
+            Worker().run(burst=True)
+        purge = CoursePurge.objects.get(course_id=self.course.pk)
+        self.assertEqual((purge.state, purge.stage), (CoursePurge.FAILED, 'views'))
+        # повтор из очереди, не дожидаясь задержки
+        Task.objects.update(run_at=timezone.now())
+        Worker().run(burst=True)
+        self.assert_purged()
+
+
+@override_settings(WEB_TASKS_EAGER=False)
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='secret')
+        category = Category.objects.create(name='Программирование')
+        tag_sets = [['python', 'django'], ['python', 'flask'], ['python'], ['django', 'orm'], ['go']]
+        cls.courses = []
+        for i, tags in enumerate(tag_sets):
+            course = create_course(cls.user, 'Course %d' % i)
+            course.tags.add(*tags)
+            if i % 2:
+                course.category.add(category)
+            cls.courses.append(course)
+        # курсы без тегов и категорий не входят в total для idf
+        for i in range(3):
+            create_course(cls.user, 'Empty %d' % i)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def links(self):
+        return {(course_id, related_id): round(score, 9) for course_id, related_id, score in
+                RelatedCourse.objects.values_list('course_id', 'related_id', 'score')}
+
+    def test_incremental_update_matches_rebuild(self):
+        rebuild_all()
+        rebuilt = self.links()
+        self.assertEqual(cache.get(TOTAL_CACHE_KEY), 5)
+        RelatedCourse.objects.filter(course=self.courses[0]).delete()
+        with CaptureQueriesContext(connection) as captured:
+            update_course(self.courses[0].pk)
+        self.assertEqual(self.links(), rebuilt)
+        # total читается из кеша, а не COUNT(*) по всем курсам
+        self.assertFalse([query for query in captured.captured_queries if 'COUNT(' in query['sql']])
+
+    def test_total_without_rebuild(self):
+        self.assertEqual(featured_course_count(), 5)
+
+
+class TaskAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='secret')
+
+    def failed_task(self, key):
+        return Task.objects.create(name='web.purge.run_purge', key=key, state=Task.FAILED, attempts=5)
+
+    def test_retry_requeues_one_task_per_key(self):
+        first, second = self.failed_task('purge:1'), self.failed_task('purge:1')
+        other = self.failed_task('')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('admin:web_task_changelist'), {
+            'action': 'retry', '_selected_action': [first.pk, second.pk, other.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(set(Task.objects.filter(state=Task.QUEUED).values_list('pk', flat=True)), {first.pk, other.pk})
+        self.assertEqual(Task.objects.get(pk=second.pk).state, Task.FAILED)
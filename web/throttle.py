@@ -0,0 +1,56 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+class TokenBucket:
+    """
+    Ведро токенов в кеше: capacity запросов подряд, дальше rate запросов в секунду.
+    Чтение и запись состояния не атомарны, при гонке лишний запрос может проскочить —
+    для защиты от флуда этого достаточно.
+    """
+
+    def __init__(self, name, capacity, per_seconds):
+        self.name = name
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+
+    def key(self, ident):
+        return 'throttle:%s:%s' % (self.name, ident)
+
+    def consume(self, ident):
+        """Возвращает 0, если запрос разрешён, иначе сколько секунд ждать."""
+        key, now = self.key(ident), time.time()
+        tokens, updated = cache.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        # ключ живёт, пока ведро не наполнится снова, дальше его состояние равно начальному
+        timeout = math.ceil((self.capacity - tokens + 1) / self.rate)
+        if tokens < 1:
+            cache.set(key, (tokens, now), timeout)
+            return math.ceil((1 - tokens) / self.rate)
+        cache.set(key, (tokens - 1, now), timeout)
+        return 0
+
+
+COMMENT_USER_BUCKET = TokenBucket('comment-user', capacity=5, per_seconds=60)
+COMMENT_IP_BUCKET = TokenBucket('comment-ip', capacity=20, per_seconds=60)
+
+
+def client_ip(request):
+    # за обратным прокси REMOTE_ADDR у всех один — адрес берётся из заголовка, который ставит сам прокси
+    if settings.WEB_CLIENT_IP_HEADER:
+        forwarded = request.META.get(settings.WEB_CLIENT_IP_HEADER, '')
+        if forwarded:
+            # в X-Forwarded-For последний адрес дописал наш прокси, остальные прислал клиент
+            return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse('Слишком много запросов, попробуйте позже', status=429,
+                            content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
@@ -0,0 +1,146 @@
+"""
+Загрузка картинок по кускам с докачкой.
+
+POST uploads/ (filename, size) создаёт загрузку. PATCH uploads/<id>/ с заголовком Upload-Offset
+дописывает тело запроса с этого места, GET отдаёт, сколько уже получено — с него и продолжать после обрыва.
+Тело читается из потока блоками и сразу пишется на диск, в памяти целиком не держится.
+Кусок занимает загрузку коротким UPDATE поля writing_since: пока тело идёт по сети, ни строка,
+ни транзакция не заблокированы. Собранный файл проверяется целиком (web.images.verify_image).
+Завершённую загрузку форма курса или профиля принимает по id в скрытом поле upload.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.http.request import UnreadablePostError
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods, require_POST
+
+from web.images import UPLOAD_EXTENSIONS, ImageRejected, NotAnImage, check_image_header, verify_image
+from web.models import Upload
+
+READ_BLOCK_SIZE = 64 * 1024
+# запрос, который занял загрузку и умер, не держит её дольше этого
+WRITE_LOCK_SECONDS = 10 * 60
+
+
+def upload_state(upload, status=200):
+    response = JsonResponse({
+        'id': str(upload.id),
+        'offset': upload.received,
+        'size': upload.size,
+        'completed': upload.completed,
+        'url': reverse('upload_detail', args=(upload.id,)),
+    }, status=status)
+    response['Upload-Offset'] = upload.received
+    return response
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def reject(upload, message):
+    upload.delete()
+    return error(message, 422)
+
+
+def check_upload(upload):
+    with open(upload.path, 'rb') as f:
+        if upload.received == upload.size:
+            verify_image(f, upload.filename)
+            return
+        # по первым кускам заголовок может ещё не прочитаться, до конца файла это не ошибка
+        try:
+            check_image_header(f)
+        except NotAnImage:
+            pass
+
+
+@require_POST
+def upload_create(request):
+    if not request.user.is_authenticated:
+        return error('Нужно войти', 401)
+    filename = os.path.basename(request.POST.get('filename', '')).strip()
+    if not filename.lower().endswith(UPLOAD_EXTENSIONS):
+        return error('Поддерживаются файлы %s' % ', '.join(UPLOAD_EXTENSIONS), 400)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return error('Не указан размер файла', 400)
+    if not 0 < size <= settings.WEB_UPLOAD_MAX_BYTES:
+        return error('Файл должен быть не больше %d МБ' % (settings.WEB_UPLOAD_MAX_BYTES // 2 ** 20), 413)
+
+    upload = Upload.objects.create(user=request.user, filename=filename[-255:], size=size)
+    os.makedirs(settings.WEB_UPLOAD_TEMP_DIR, exist_ok=True)
+    open(upload.path, 'wb').close()
+    return upload_state(upload, status=201)
+
+
+@require_http_methods(['GET', 'HEAD', 'PATCH'])
+def upload_detail(request, id):
+    if not request.user.is_authenticated:
+        return error('Нужно войти', 401)
+    if request.method != 'PATCH':
+        upload = Upload.objects.filter(pk=id, user=request.user).first()
+        if upload is None:
+            raise Http404('Загрузка не найдена')
+        return upload_state(upload)
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        length = int(request.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return error('Нужны заголовки Upload-Offset и Content-Length', 400)
+
+    uploads = Upload.objects.filter(pk=id, user=request.user)
+    claimed_at = timezone.now()
+    claimed = (
+        uploads
+        .filter(completed=False, received=offset, size__gte=offset + length)
+        .filter(Q(writing_since__isnull=True)
+                | Q(writing_since__lt=claimed_at - timedelta(seconds=WRITE_LOCK_SECONDS)))
+        .update(writing_since=claimed_at)
+    )
+    if not claimed:
+        upload = uploads.first()
+        if upload is None:
+            raise Http404('Загрузка не найдена')
+        if upload.completed or offset != upload.received:
+            return upload_state(upload, status=409)
+        if offset + length > upload.size:
+            return error('Кусок выходит за объявленный размер файла', 413)
+        # второй кусок той же загрузки, пришедший параллельно, не ждёт, а получает 409
+        return error('Предыдущий кусок ещё записывается', 409)
+
+    upload = uploads.get()
+    written = 0
+    with open(upload.path, 'r+b') as f:
+        f.seek(offset)
+        f.truncate()
+        try:
+            while written < length:
+                block = request.read(min(READ_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+        except UnreadablePostError:
+            # обрыв соединения: сохраняем, сколько дошло, клиент продолжит с этого места
+            pass
+
+    upload.received = offset + written
+    try:
+        check_upload(upload)
+    except ImageRejected as e:
+        return reject(upload, str(e))
+    upload.completed = upload.received == upload.size
+    # занятие истекло и загрузку взял другой запрос — его данные важнее
+    if not uploads.filter(writing_since=claimed_at).update(
+            received=upload.received, completed=upload.completed, writing_since=None):
+        return error('Кусок перехвачен другим запросом', 409)
+    upload.writing_since = None
+    return upload_state(upload)
@@ -13,21 +13,50 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.urls import path
+from django.conf import settings
+from django.urls import path, register_converter
+from django.urls.converters import SlugConverter
 from django.contrib.auth.decorators import login_required
 
-from . import views
+from . import api, async_views, feeds, sitemaps, uploads, views
+
+# каталог, теги и страница курса — самые нагруженные на чтение, под ASGI их можно отдать async-версиям
+catalog_views = async_views if settings.WEB_ASYNC_VIEWS else views
+
+
+class UnicodeSlugConverter(SlugConverter):
+    # слаги курсов и тегов строятся с allow_unicode=True, у русских названий в них кириллица
+    regex = r'[-\w]+'
+
+
+register_converter(UnicodeSlugConverter, 'uslug')
 
 urlpatterns = [
-    path('', views.CourseListView.as_view(), name='main_page'),
+    path('', catalog_views.CourseListView.as_view(), name='main_page'),
     path('add_course', login_required(views.CourseCreateView.as_view()), name='course_create'),
-    path('<slug:tag_slug>', views.TagIndexView.as_view(), name='courses_by_tag'),
-    path('<slug:slug>/<int:id>', views.CourseDetailView.as_view(), name='single_course'),
-    path('<slug:slug>/<int:id>/delete', login_required(views.CourseDeleteView.as_view()), name='course_delete'),
-    path('<slug:slug>/<int:id>/edit', login_required(views.CourseUpdateView.as_view()), name='course_update'),
-    path('<slug:slug>/<int:course_id>/comment/<int:id>/delete', login_required(views.CommentDeleteView.as_view()),
+    path('search/', views.CourseSearchView.as_view(), name='course_search'),
+    path('catalog/', views.CatalogView.as_view(), name='course_catalog'),
+    path('api/courses/', api.course_list, name='api_courses'),
+    path('api/courses/<int:id>/', api.course_detail, name='api_course'),
+    path('api/courses/<int:id>/comments/', api.course_comments, name='api_course_comments'),
+    path('api/tags/', api.tag_list, name='api_tags'),
+    path('uploads/', uploads.upload_create, name='upload_create'),
+    path('uploads/<uuid:id>/', uploads.upload_detail, name='upload_detail'),
+    path('sitemap.xml', sitemaps.index, name='sitemap_index'),
+    path('sitemap-<slug:section>-<int:shard>.xml', sitemaps.shard, name='sitemap_shard'),
+    path('feeds/courses.rss', feeds.courses_rss, name='courses_rss'),
+    path('feeds/courses.atom', feeds.courses_atom, name='courses_atom'),
+    path('feeds/tags/<uslug:tag_slug>.rss', feeds.tag_rss, name='tag_rss'),
+    path('feeds/tags/<uslug:tag_slug>.atom', feeds.tag_atom, name='tag_atom'),
+    path('feeds/categories/<int:category_id>.rss', feeds.category_rss, name='category_rss'),
+    path('feeds/categories/<int:category_id>.atom', feeds.category_atom, name='category_atom'),
+    path('<uslug:tag_slug>', catalog_views.TagIndexView.as_view(), name='courses_by_tag'),
+    path('<uslug:slug>/<int:id>', catalog_views.CourseDetailView.as_view(), name='single_course'),
+    path('<uslug:slug>/<int:id>/delete', login_required(views.CourseDeleteView.as_view()), name='course_delete'),
+    path('<uslug:slug>/<int:id>/edit', login_required(views.CourseUpdateView.as_view()), name='course_update'),
+    path('<uslug:slug>/<int:course_id>/comment/<int:id>/delete', login_required(views.CommentDeleteView.as_view()),
          name='delete_comment'),
-    path('<slug:slug>/<int:course_id>/comment/<int:id>/edit', login_required(views.CommentUpdateView.as_view()),
+    path('<uslug:slug>/<int:course_id>/comment/<int:id>/edit', login_required(views.CommentUpdateView.as_view()),
          name='update_comment'),
     path('login/', views.login, name='login'),
     path('register/', views.register, name='register'),
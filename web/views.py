@@ -1,3 +1,5 @@
+from django.contrib.postgres.search import SearchRank
+from django.db.models import F
 from django.shortcuts import render, HttpResponseRedirect
 from django.urls import reverse
 from django.utils.text import slugify
@@ -5,42 +7,163 @@ from django.views.generic import UpdateView, DeleteView, CreateView, ListView, D
 from django.views.generic.edit import FormMixin
 from django.contrib import auth, messages
 from django.contrib.auth.decorators import login_required
-
-from web.models import Course, Comment, Category
+from django.contrib.auth.views import redirect_to_login
+from django.db import transaction
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+
+from web.backends import CACHED_BACKEND
+from web.cache import (AnonymousPageCacheMixin, CATALOG_NAMESPACE, CATEGORIES_NAMESPACE, RELATED_NAMESPACE,
+                       course_namespace, tag_namespace)
+from web.cards import cards_in_order
+from web.facets import CatalogFilters, facet_counts
+from web.models import Course, CourseCard, Comment, RelatedCourse, TagCount, course_search_query
 from web.forms import UserLoginForm, UserRegistrationForm, UserProfileForm, CommentForm, CourseForm
+from web.pagination import KeysetPaginationMixin, KeysetPaginator
+from web.popularity import PopularPaginator, record_view
+from web.purge import soft_delete_course
+from web.recommendations import RELATED_LIMIT
+from web.throttle import COMMENT_IP_BUCKET, COMMENT_USER_BUCKET, client_ip, too_many_requests
 
 
-class TagIndexView(ListView):
-    model = Course
+def course_cards():
+    # сетки курсов читают готовые карточки (web.cards), без JOIN автора и догрузки тегов и категорий
+    return CourseCard.objects.all()
+
+
+def tag_course_cards(tag_slug):
+    return CourseCard.objects.filter(tag_slugs__contains=[tag_slug])
+
+
+def course_comments(course):
+    return (
+        course.course_comments
+        .select_related('user')
+        .only('id', 'text', 'create_date', 'course_id', 'user__id', 'user__username', 'user__image')
+    )
+
+
+class PopularSortMixin:
+    # ?sort=popular — по просмотрам за последние дни вместо новых сверху
+    popular_sort = 'popular'
+
+    def is_popular(self):
+        return self.request.GET.get('sort') == self.popular_sort
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.is_popular():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = PopularPaginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data(object_list=object_list, **kwargs)
+        if self.is_popular():
+            context.update(sort=self.popular_sort, pagination_query='sort=' + self.popular_sort)
+        return context
+
+
+class TagIndexView(AnonymousPageCacheMixin, PopularSortMixin, KeysetPaginationMixin, ListView):
+    model = CourseCard
+    replica_reads = True
     template_name = 'web/index.html'
     context_object_name = 'courses'
 
+    def get_cache_namespaces(self):
+        return [tag_namespace(self.kwargs.get('tag_slug')), CATEGORIES_NAMESPACE]
+
     def get_queryset(self):
-        return Course.objects.filter(tags__slug=self.kwargs.get('tag_slug'))
+        return tag_course_cards(self.kwargs.get('tag_slug'))
 
     def get_context_data(self, *, object_list=None, **kwargs):
         return {
             **super(TagIndexView, self).get_context_data(**kwargs),
-            'most_popular_tags': Course.tags.most_common()[:3],
+            'most_popular_tags': TagCount.objects.most_common(3),
         }
 
 
-class CourseListView(ListView):
+class CourseListView(AnonymousPageCacheMixin, PopularSortMixin, KeysetPaginationMixin, ListView):
     template_name = 'web/index.html'
-    model = Course
+    replica_reads = True
+    model = CourseCard
     context_object_name = 'courses'
     slug_field = 'id'
     slug_url_kwarg = 'id'
 
+    def get_cache_namespaces(self):
+        return [CATALOG_NAMESPACE]
+
+    def get_queryset(self):
+        return course_cards()
+
     def get_context_data(self, *, object_list=None, **kwargs):
         return {
             **super(CourseListView, self).get_context_data(**kwargs),
-            'most_popular_tags': Course.tags.most_common()[:3],
-            'category': Category.objects.all()
+            'most_popular_tags': TagCount.objects.most_common(3),
+        }
+
+
+class CatalogView(AnonymousPageCacheMixin, KeysetPaginationMixin, ListView):
+    template_name = 'web/catalog.html'
+    replica_reads = True
+    context_object_name = 'courses'
+
+    def get_cache_namespaces(self):
+        return [CATALOG_NAMESPACE, CATEGORIES_NAMESPACE]
+
+    def get_queryset(self):
+        self.filters = CatalogFilters(self.request.GET)
+        return self.filters.apply(course_cards())
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        return {
+            **super(CatalogView, self).get_context_data(**kwargs),
+            'facets': facet_counts(self.filters),
+            'pagination_query': self.filters.querystring(),
         }
 
 
-class CourseCreateView(CreateView):
+class CourseSearchView(ListView):
+    template_name = 'web/search.html'
+    context_object_name = 'courses'
+    paginate_by = 12
+
+    def get_search_query(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_queryset(self):
+        query = self.get_search_query()
+        if not query:
+            return Course.objects.none()
+        search_query = course_search_query(query)
+        return (
+            Course.objects.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', '-id')
+            .values_list('id', flat=True)
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        # ранжирует поиск таблица курсов, а показываем карточки найденных в том же порядке
+        paginator, page, course_ids, is_paginated = super().paginate_queryset(queryset, page_size)
+        page.object_list = cards_in_order(list(course_ids))
+        return paginator, page, page.object_list, is_paginated
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        return {
+            **super(CourseSearchView, self).get_context_data(**kwargs),
+            'query': self.get_search_query(),
+        }
+
+
+class UploaderFormMixin:
+    # форма принимает загрузки по кускам только от того, кто их загрузил
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'uploader': self.request.user}
+
+
+class CourseCreateView(UploaderFormMixin, CreateView):
     template_name = 'web/add_course.html'
     form_class = CourseForm
 
@@ -54,30 +177,71 @@ class CourseCreateView(CreateView):
 
 
 # FormMixin - тк в DetailView нет form_class
-class CourseDetailView(FormMixin, DetailView):
+class CourseDetailView(AnonymousPageCacheMixin, FormMixin, DetailView):
     template_name = 'web/course-single.html'
+    replica_reads = True
     form_class = CommentForm
     model = Course
     slug_field = 'id'
     slug_url_kwarg = 'id'
+    comments_per_page = 20
+
+    def get_cache_namespaces(self):
+        return [course_namespace(self.kwargs['id']), RELATED_NAMESPACE]
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        # просмотр засчитывается и для страницы, отданной из кеша
+        if request.method == 'GET' and response.status_code == 200:
+            record_view(kwargs['id'])
+        return response
+
+    def get_queryset(self):
+        return Course.objects.defer('search_vector').select_related('user')
+
+    def get_comments_page(self):
+        paginator = KeysetPaginator(course_comments(self.object), self.comments_per_page, date_field='create_date')
+        return paginator.page(self.request.GET.get('comments'))
+
+    def get_context_data(self, **kwargs):
+        return {
+            **super(CourseDetailView, self).get_context_data(**kwargs),
+            'comments_page': self.get_comments_page(),
+            'related_courses': RelatedCourse.objects.top_for(self.object.pk, RELATED_LIMIT),
+        }
 
     def post(self, request, *args, **kwargs):
-        form = self.get_form()
+        # анонимный POST только уводит на вход и не тратит ведро адреса, общее для всех за одним NAT
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        retry_after = COMMENT_IP_BUCKET.consume(client_ip(request)) or COMMENT_USER_BUCKET.consume(request.user.pk)
+        if retry_after:
+            return too_many_requests(retry_after)
 
-        if form.is_valid():
-            return self.form_valid(form)
-        else:
+        form = self.get_form()
+        if not form.is_valid():
+            self.object = self.get_object()
             return self.form_invalid(form)
+        return self.form_valid(form)
 
     def form_valid(self, form):
-        self.object = form.save(commit=False)
-        self.object.course = self.get_object()
-        self.object.user = self.request.user
-        self.object.save()
-        return super().form_valid(form)
-
-    def get_success_url(self):
-        return reverse('single_course', args=(self.kwargs['slug'], self.kwargs['id']))
+        # курс читается с блокировкой в той же транзакции, что и сохранение: мягкое удаление ждёт коммита,
+        # а комментарий к уже удалённому курсу не сохранится; счётчик комментариев обновляет сигнал,
+        # версии кеша поднимаются после коммита
+        comment = form.save(commit=False)
+        comment.course_id = self.kwargs['id']
+        comment.user = self.request.user
+        with transaction.atomic():
+            slug = (
+                Course.objects.select_for_update(no_key=True)
+                .filter(pk=self.kwargs['id'])
+                .values_list('slug', flat=True)
+                .first()
+            )
+            if slug is None:
+                raise Http404('Курс не найден')
+            comment.save()
+        return HttpResponseRedirect(reverse('single_course', args=(slug, self.kwargs['id'])))
 
 
 class CourseDeleteView(DeleteView):
@@ -86,11 +250,18 @@ class CourseDeleteView(DeleteView):
     slug_field = 'id'
     slug_url_kwarg = 'id'
 
+    def form_valid(self, form):
+        if self.object.user_id != self.request.user.id:
+            raise PermissionDenied
+        # курс пропадает сразу, комментарии и прочие зависимые строки дочищаются в фоне
+        soft_delete_course(self.object)
+        return HttpResponseRedirect(self.get_success_url())
+
     def get_success_url(self):
         return reverse('main_page')
 
 
-class CourseUpdateView(UpdateView):
+class CourseUpdateView(UploaderFormMixin, UpdateView):
     template_name = 'web/course_edit.html'
     model = Course
     form_class = CourseForm
@@ -138,14 +309,12 @@ class CommentDeleteView(DeleteView):
 
 def login(request):
     if request.method == 'POST':
-        form = UserLoginForm(data=request.POST)
+        form = UserLoginForm(request, data=request.POST)
         if form.is_valid():
-            username = request.POST['username']
-            password = request.POST['password']
-            user = auth.authenticate(username=username, password=password)
-            if user and user.is_active:
-                auth.login(request, user)
-                return HttpResponseRedirect(reverse('main_page'))
+            # форма уже вызвала authenticate() и проверила is_active, второй раз пароль не хешируем;
+            # сессия привязывается к бэкенду, который кеширует пользователя
+            auth.login(request, form.get_user(), backend=CACHED_BACKEND)
+            return HttpResponseRedirect(reverse('main_page'))
     else:
         form = UserLoginForm()
     return render(request, 'web/login.html', {
@@ -171,7 +340,7 @@ def register(request):
 def profile(request):
     user = request.user
     if request.method == 'POST':
-        form = UserProfileForm(data=request.POST, files=request.FILES, instance=user)
+        form = UserProfileForm(data=request.POST, files=request.FILES, instance=user, uploader=user)
         if form.is_valid():
             form.save()
             return HttpResponseRedirect(reverse('profile'))